@@ -1,8 +1,10 @@
 from http import HTTPStatus
 from typing import Annotated
 
-from fastapi import APIRouter, Depends, HTTPException, Query
-from models.models import FilmShort, Film, GenreType, MultiParams, Sort
+from core.http_cache import json_response
+from fastapi import APIRouter, Depends, HTTPException, Query, Request, Response
+from models.models import BatchIds, FilmShort, Film, GenreType, MultiParams, Sort
+from services.base import InvalidCursor
 from services.film import FilmService, get_film_service
 
 from models.models import QueryParams
@@ -16,11 +18,12 @@ router = APIRouter()
     summary="Поиск фильмов",
 )
 async def film_search(
+    request: Request,
     query: Annotated[str, Query(..., description="Query params")],
     page: Annotated[int, Query(description="Pagination page number", ge=1)] = 1,
     size: Annotated[int, Query(description="Pagination page size", ge=1)] = 100,
     film_service: FilmService = Depends(get_film_service),
-) -> list[Film]:
+) -> Response:
     film = await film_service.search_films(
         QueryParams(**{"query": query, "page": page, "size": size})
     )
@@ -28,7 +31,7 @@ async def film_search(
     if not film:
         raise HTTPException(status_code=HTTPStatus.NOT_FOUND, detail="movie not found")
 
-    return film
+    return json_response(request, film)
 
 
 @router.get(
@@ -38,6 +41,7 @@ async def film_search(
     description="Список фильмов с возможностью фильтрации и сортировки",
 )
 async def film_list(
+    request: Request,
     multi_params: MultiParams = Depends(),
     title: str | None = Query(default=None),
     imdb_rating: Sort | None = None,
@@ -45,17 +49,59 @@ async def film_list(
     director: str = Query(default=None),
     page_number: Annotated[int, Query(description="Pagination page number", ge=1)] = 1,
     page_count: Annotated[int, Query(description="Pagination page size", ge=1)] = 100,
+    cursor: Annotated[
+        str | None,
+        Query(description="Next page cursor from the X-Next-Cursor header"),
+    ] = None,
     film_service: FilmService = Depends(get_film_service),
-) -> list[Film]:
-
-    films = await film_service.get_list(
-        title,
-        imdb_rating,
-        genre,
-        director,
-        multi_params,
-        page_number,
-        page_count,
-    )
+) -> Response:
+
+    try:
+        films, next_cursor = await film_service.get_list(
+            title,
+            imdb_rating,
+            genre,
+            director,
+            multi_params,
+            page_number,
+            page_count,
+            cursor,
+        )
+    except InvalidCursor as ex:
+        raise HTTPException(status_code=HTTPStatus.BAD_REQUEST, detail=str(ex))
+
+    headers = {"X-Next-Cursor": next_cursor} if next_cursor else None
+    return json_response(request, films, headers)
+
+
+@router.get(
+    "/{film_id}",
+    response_model=Film,
+    summary="Информация о фильме",
+)
+async def film_details(
+    request: Request,
+    film_id: str,
+    film_service: FilmService = Depends(get_film_service),
+) -> Response:
+    # Json из кеша отдаётся как есть, без разбора в модель и повторной сериализации
+    film = await film_service.get_raw_by_id(film_id)
+    if not film:
+        raise HTTPException(status_code=HTTPStatus.NOT_FOUND, detail="movie not found")
+
+    return json_response(request, film)
+
+
+@router.post(
+    "/_batch",
+    response_model=list[Film],
+    summary="Пакетное получение фильмов",
+    description="Возвращает найденные объекты по списку id за один запрос",
+)
+async def film_batch(
+    batch: BatchIds,
+    film_service: FilmService = Depends(get_film_service),
+) -> Response:
+    films = await film_service.get_many_raw(batch.ids)
 
-    return films
+    return Response(content=films, media_type="application/json")
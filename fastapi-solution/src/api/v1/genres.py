@@ -1,7 +1,10 @@
+from http import HTTPStatus
 from typing import Annotated
 
-from fastapi import APIRouter, Depends, Query
-from models.models import Genre
+from core.http_cache import json_response
+from fastapi import APIRouter, Depends, HTTPException, Query, Request, Response
+from models.models import BatchIds, Genre
+from services.base import InvalidCursor
 from services.genre import GenreService, get_genre_service
 
 router = APIRouter()
@@ -14,16 +17,58 @@ router = APIRouter()
     description="Список жанров с возможностью фильтрации и сортировки",
 )
 async def genre_list(
+    request: Request,
     name: str | None = Query(default=None),
     page_number: Annotated[int, Query(description="Pagination page number", ge=1)] = 1,
     page_count: Annotated[int, Query(description="Pagination page size", ge=1)] = 100,
+    cursor: Annotated[
+        str | None,
+        Query(description="Next page cursor from the X-Next-Cursor header"),
+    ] = None,
     genre_service: GenreService = Depends(get_genre_service),
-) -> list[Genre]:
+) -> Response:
 
-    genre = await genre_service.get_list(
-        name,
-        page_number,
-        page_count,
-    )
+    try:
+        genre, next_cursor = await genre_service.get_list(
+            name,
+            page_number,
+            page_count,
+            cursor,
+        )
+    except InvalidCursor as ex:
+        raise HTTPException(status_code=HTTPStatus.BAD_REQUEST, detail=str(ex))
 
-    return genre
+    headers = {"X-Next-Cursor": next_cursor} if next_cursor else None
+    return json_response(request, genre, headers)
+
+
+@router.get(
+    "/{genre_id}",
+    response_model=Genre,
+    summary="Информация о жанре",
+)
+async def genre_details(
+    request: Request,
+    genre_id: str,
+    genre_service: GenreService = Depends(get_genre_service),
+) -> Response:
+    genre = await genre_service.get_raw_by_id(genre_id)
+    if not genre:
+        raise HTTPException(status_code=HTTPStatus.NOT_FOUND, detail="genre not found")
+
+    return json_response(request, genre)
+
+
+@router.post(
+    "/_batch",
+    response_model=list[Genre],
+    summary="Пакетное получение жанров",
+    description="Возвращает найденные объекты по списку id за один запрос",
+)
+async def genre_batch(
+    batch: BatchIds,
+    genre_service: GenreService = Depends(get_genre_service),
+) -> Response:
+    genres = await genre_service.get_many_raw(batch.ids)
+
+    return Response(content=genres, media_type="application/json")
@@ -1,8 +1,10 @@
 from http import HTTPStatus
 from typing import Annotated
 
-from fastapi import APIRouter, Depends, HTTPException, Query
-from models.models import Person
+from core.http_cache import json_response
+from fastapi import APIRouter, Depends, HTTPException, Query, Request, Response
+from models.models import BatchIds, Person
+from services.base import InvalidCursor
 from services.person import PersonService, get_person_service
 from models.models import QueryParams
 
@@ -15,11 +17,12 @@ router = APIRouter()
     summary="Поиск персон",
 )
 async def person_search(
+    request: Request,
     query: Annotated[str, Query(..., description="Query params")],
     page: Annotated[int, Query(description="Pagination page number", ge=1)] = 1,
     size: Annotated[int, Query(description="Pagination page size", ge=1)] = 100,
     person_service: PersonService = Depends(get_person_service),
-) -> list[Person]:
+) -> Response:
     person = await person_service.search_persons(
         QueryParams(**{"query": query, "page": page, "size": size})
     )
@@ -27,7 +30,7 @@ async def person_search(
     if not person:
         raise HTTPException(status_code=HTTPStatus.NOT_FOUND, detail="person not found")
 
-    return person
+    return json_response(request, person)
 
 
 @router.get(
@@ -37,16 +40,58 @@ async def person_search(
     description="Список персон с возможностью фильтрации и сортировки",
 )
 async def person_list(
+    request: Request,
     full_name: str | None = Query(default=None),
     page_number: Annotated[int, Query(description="Pagination page number", ge=1)] = 1,
     page_count: Annotated[int, Query(description="Pagination page size", ge=1)] = 100,
+    cursor: Annotated[
+        str | None,
+        Query(description="Next page cursor from the X-Next-Cursor header"),
+    ] = None,
     person_service: PersonService = Depends(get_person_service),
-) -> list[Person]:
+) -> Response:
 
-    person = await person_service.get_list(
-        full_name,
-        page_number,
-        page_count,
-    )
+    try:
+        person, next_cursor = await person_service.get_list(
+            full_name,
+            page_number,
+            page_count,
+            cursor,
+        )
+    except InvalidCursor as ex:
+        raise HTTPException(status_code=HTTPStatus.BAD_REQUEST, detail=str(ex))
+
+    headers = {"X-Next-Cursor": next_cursor} if next_cursor else None
+    return json_response(request, person, headers)
+
+
+@router.get(
+    "/{person_id}",
+    response_model=Person,
+    summary="Информация о персоне",
+)
+async def person_details(
+    request: Request,
+    person_id: str,
+    person_service: PersonService = Depends(get_person_service),
+) -> Response:
+    person = await person_service.get_raw_by_id(person_id)
+    if not person:
+        raise HTTPException(status_code=HTTPStatus.NOT_FOUND, detail="person not found")
+
+    return json_response(request, person)
+
+
+@router.post(
+    "/_batch",
+    response_model=list[Person],
+    summary="Пакетное получение персон",
+    description="Возвращает найденные объекты по списку id за один запрос",
+)
+async def person_batch(
+    batch: BatchIds,
+    person_service: PersonService = Depends(get_person_service),
+) -> Response:
+    persons = await person_service.get_many_raw(batch.ids)
 
-    return person
+    return Response(content=persons, media_type="application/json")
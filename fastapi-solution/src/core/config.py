@@ -15,6 +15,45 @@ class Settings(BaseSettings):
     redis_port: int = Field(6379, env="REDIS_PORT")
     elastic_host: str = Field("elk", env="ELASTIC_HOST")
     elastic_port: int = Field(9200, env="ELASTIC_PORT")
+    # Схлопывание промахов кеша между воркерами через блокировку в Redis
+    cache_redis_lock: bool = Field(False, env="CACHE_REDIS_LOCK")
+    cache_lock_timeout: float = Field(5.0, env="CACHE_LOCK_TIMEOUT")
+    # Сколько устаревших записей кеша может обновляться в фоне одновременно
+    cache_refresh_concurrency: int = Field(10, env="CACHE_REFRESH_CONCURRENCY")
+    # Канал, в который postgres_to_es публикует id переиндексированных документов
+    cache_invalidation_channel: str = Field(
+        "etl-updates", env="CACHE_INVALIDATION_CHANNEL"
+    )
+    # Время жизни point-in-time для пагинации по курсору, например "1m".
+    # Если не задано, страницы по курсору читаются без снимка индекса
+    es_pit_keep_alive: str | None = Field(None, env="ES_PIT_KEEP_ALIVE")
+    # In-process L1-кеш объектов: короткий TTL ограничивает устаревание данных
+    l1_cache_ttl: float = Field(10.0, env="L1_CACHE_TTL")
+    l1_cache_max_items: int = Field(10_000, env="L1_CACHE_MAX_ITEMS")
+    l1_cache_max_bytes: int = Field(64 * 1024 * 1024, env="L1_CACHE_MAX_BYTES")
+    # Таймаут одной попытки, общий срок вызова с повторами и число повторов
+    # для Elasticsearch и Redis
+    elastic_timeout: float = Field(2.0, env="ELASTIC_TIMEOUT")
+    elastic_deadline: float = Field(5.0, env="ELASTIC_DEADLINE")
+    elastic_retries: int = Field(2, env="ELASTIC_RETRIES")
+    redis_timeout: float = Field(0.5, env="REDIS_TIMEOUT")
+    redis_deadline: float = Field(1.0, env="REDIS_DEADLINE")
+    redis_retries: int = Field(1, env="REDIS_RETRIES")
+    # Автомат защиты: после стольких ошибок подряд зависимость считается
+    # недоступной на breaker_reset_timeout секунд
+    breaker_failure_threshold: int = Field(5, env="BREAKER_FAILURE_THRESHOLD")
+    breaker_reset_timeout: float = Field(10.0, env="BREAKER_RESET_TIMEOUT")
+    # Cache-Control ответов: сколько секунд клиент и nginx считают ответ свежим
+    # и сколько ещё могут отдавать устаревший, пока обновляют его в фоне.
+    # Короткий срок, потому что ETL меняет документы без уведомления клиентов
+    http_cache_max_age: int = Field(5, env="HTTP_CACHE_MAX_AGE")
+    http_cache_stale: int = Field(30, env="HTTP_CACHE_STALE")
+    # Профилирование запросов с заголовком X-Profile (нужен pyinstrument).
+    # Только для отладки: отчёт отдаётся любому, кто пришлёт заголовок
+    profiling_enabled: bool = Field(False, env="PROFILING_ENABLED")
 
     class Config:
         env_file = "../../../.env"
+
+
+settings = Settings()
@@ -0,0 +1,48 @@
+from hashlib import blake2b
+from http import HTTPStatus
+
+from fastapi import Request, Response
+
+from core.config import settings
+
+
+def etag(content: bytes) -> str:
+    """
+    Сильный ETag: хеш готового json, поэтому совпадает байт в байт
+    у всех воркеров, отдающих одну и ту же версию документа
+    """
+
+    return f'"{blake2b(content, digest_size=16).hexdigest()}"'
+
+
+def not_modified(request: Request, tag: str) -> bool:
+    header = request.headers.get("if-none-match")
+    if not header:
+        return False
+    if header.strip() == "*":
+        return True
+    # Для If-None-Match сравнение слабое: W/"x" совпадает с "x"
+    return any(
+        value.strip().removeprefix("W/") == tag for value in header.split(",")
+    )
+
+
+def json_response(
+    request: Request, content: bytes, headers: dict[str, str] | None = None
+) -> Response:
+    """
+    Ответ с json из кеша: ETag, Cache-Control и 304, если у клиента
+    (или у nginx перед API) уже есть эта версия
+    """
+
+    headers = {
+        "ETag": etag(content),
+        "Cache-Control": (
+            f"public, max-age={settings.http_cache_max_age}, "
+            f"stale-while-revalidate={settings.http_cache_stale}"
+        ),
+    } | (headers or {})
+
+    if not_modified(request, headers["ETag"]):
+        return Response(status_code=HTTPStatus.NOT_MODIFIED, headers=headers)
+    return Response(content=content, media_type="application/json", headers=headers)
@@ -0,0 +1,188 @@
+import logging
+import time
+
+from prometheus_client import Counter, Gauge, Histogram
+from prometheus_client.core import CounterMetricFamily, GaugeMetricFamily
+from prometheus_client.registry import Collector
+from starlette.responses import HTMLResponse
+from starlette.types import ASGIApp, Message, Receive, Scope, Send
+
+# Границы гистограмм в секундах: от попадания в L1 до медленного поиска
+LATENCY_BUCKETS = (
+    0.0005,
+    0.001,
+    0.0025,
+    0.005,
+    0.01,
+    0.025,
+    0.05,
+    0.1,
+    0.25,
+    0.5,
+    1,
+    2.5,
+    5,
+)
+
+REQUEST_SECONDS = Histogram(
+    "api_request_seconds",
+    "Время обработки запроса",
+    ["method", "route", "status"],
+    buckets=LATENCY_BUCKETS,
+)
+CACHE_REQUESTS = Counter(
+    "api_cache_requests_total",
+    "Обращения к Redis: слой redis (объекты) или query (списки и поиск), "
+    "результат hit, miss или stale. L1 считается в api_l1_hits/api_l1_misses",
+    ["prefix", "layer", "result"],
+)
+REDIS_SECONDS = Histogram(
+    "api_redis_seconds",
+    "Время команд Redis",
+    ["prefix", "operation"],
+    buckets=LATENCY_BUCKETS,
+)
+ES_SECONDS = Histogram(
+    "api_elastic_seconds",
+    "Время запроса к Elasticsearch со стороны клиента",
+    ["index", "operation"],
+    buckets=LATENCY_BUCKETS,
+)
+ES_TOOK_SECONDS = Histogram(
+    "api_elastic_took_seconds",
+    "Время выполнения поиска на стороне Elasticsearch (took)",
+    ["index", "operation"],
+    buckets=LATENCY_BUCKETS,
+)
+SERIALIZE_SECONDS = Histogram(
+    "api_serialize_seconds",
+    "Время валидации и сериализации моделей pydantic",
+    ["model"],
+    buckets=LATENCY_BUCKETS,
+)
+BREAKER_STATE = Gauge(
+    "api_circuit_breaker_state",
+    "Состояние автомата защиты: 0 — замкнут, 1 — разомкнут, 2 — пробный вызов",
+    ["dependency"],
+)
+DEPENDENCY_RETRIES = Counter(
+    "api_dependency_retries_total", "Повторы вызовов зависимостей", ["dependency"]
+)
+
+# Заголовок запроса, включающий профилирование, если оно разрешено в настройках
+PROFILE_HEADER = b"x-profile"
+
+logger = logging.getLogger(__name__)
+
+
+class ServiceCollector(Collector):
+    """
+    Счётчики, которые сервисы ведут сами (L1, single-flight, отметки
+    об отсутствии объекта, фоновые обновления): читаются только при сборе метрик
+    """
+
+    def __init__(self, services: dict):
+        self.services = services
+
+    def collect(self):
+        counters = {
+            "api_l1_hits": ("Попадания в L1", lambda s: s.l1.hits),
+            "api_l1_misses": ("Промахи L1", lambda s: s.l1.misses),
+            "api_l1_evictions": ("Вытеснения из L1", lambda s: s.l1.evictions),
+            "api_singleflight_coalesced": (
+                "Промахи, дождавшиеся чужой загрузки",
+                lambda s: s.single_flight.coalesced,
+            ),
+            "api_tombstone_hits": (
+                "Попадания в отметки об отсутствии объекта",
+                lambda s: s.tombstone_hits,
+            ),
+            "api_tombstones_stored": (
+                "Записанные отметки об отсутствии объекта",
+                lambda s: s.tombstones_stored,
+            ),
+            "api_cache_background_refreshes": (
+                "Фоновые обновления устаревших записей",
+                lambda s: s.refresher.refreshed,
+            ),
+        }
+        for name, (documentation, value) in counters.items():
+            family = CounterMetricFamily(name, documentation, labels=["prefix"])
+            for service in self.services.values():
+                family.add_metric([service.cache_prefix], value(service))
+            yield family
+
+        gauges = {
+            "api_l1_items": ("Записей в L1", lambda s: len(s.l1)),
+            "api_cache_generation": (
+                "Поколение индекса в ключах кеша списков",
+                lambda s: s.generation,
+            ),
+        }
+        for name, (documentation, value) in gauges.items():
+            family = GaugeMetricFamily(name, documentation, labels=["prefix"])
+            for service in self.services.values():
+                family.add_metric([service.cache_prefix], value(service))
+            yield family
+
+
+class MetricsMiddleware:
+    """
+    ASGI-middleware: время запроса по шаблону маршрута (а не по пути,
+    чтобы id не раздували число рядов) и код ответа.
+
+    Если profiling включён, запрос с заголовком X-Profile выполняется
+    под сэмплирующим профилировщиком pyinstrument и вместо ответа
+    возвращается html-отчёт
+    """
+
+    def __init__(self, app: ASGIApp, profiling: bool = False):
+        self.app = app
+        self.profiling = profiling
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        if self.profiling and PROFILE_HEADER in dict(scope["headers"]):
+            await self._profile(scope, receive, send)
+            return
+
+        status = 500
+
+        async def send_wrapper(message: Message):
+            nonlocal status
+            if message["type"] == "http.response.start":
+                status = message["status"]
+            await send(message)
+
+        started = time.perf_counter()
+        try:
+            await self.app(scope, receive, send_wrapper)
+        finally:
+            # Маршрут появляется в scope после того, как роутер его нашёл
+            route = scope.get("route")
+            REQUEST_SECONDS.labels(
+                scope["method"], route.path if route else "unmatched", status
+            ).observe(time.perf_counter() - started)
+
+    async def _profile(self, scope: Scope, receive: Receive, send: Send):
+        try:
+            from pyinstrument import Profiler
+        except ImportError:
+            logger.warning("pyinstrument is not installed, profiling is skipped")
+            await self.app(scope, receive, send)
+            return
+
+        async def discard(message: Message):
+            pass
+
+        profiler = Profiler(async_mode="enabled")
+        profiler.start()
+        try:
+            await self.app(scope, receive, discard)
+        finally:
+            profiler.stop()
+
+        await HTMLResponse(profiler.output_html())(scope, receive, send)
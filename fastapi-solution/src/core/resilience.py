@@ -0,0 +1,135 @@
+import asyncio
+import logging
+import random
+import time
+from typing import Awaitable, Callable, TypeVar
+
+from core.metrics import BREAKER_STATE, DEPENDENCY_RETRIES
+
+T = TypeVar("T")
+
+logger = logging.getLogger(__name__)
+
+
+class ServiceUnavailable(Exception):
+    """Зависимость недоступна: автомат разомкнут или исчерпаны повторы"""
+
+
+class CircuitBreaker:
+    """
+    Автомат защиты зависимости.
+
+    После failure_threshold ошибок подряд размыкается: вызовы сразу получают
+    отказ, не дожидаясь таймаута. Через reset_timeout пропускает один пробный
+    вызов — его успех замыкает автомат, ошибка снова размыкает.
+    """
+
+    CLOSED, OPEN, HALF_OPEN = 0, 1, 2
+
+    def __init__(self, name: str, failure_threshold: int, reset_timeout: float):
+        self.name = name
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.failures = 0
+        self.opened_at = 0.0
+        self._set(self.CLOSED)
+
+    def _set(self, state: int):
+        self.state = state
+        BREAKER_STATE.labels(self.name).set(state)
+
+    @property
+    def is_open(self) -> bool:
+        # Вызовы сейчас отклоняются: автомат разомкнут или идёт пробный вызов
+        return (
+            self.state != self.CLOSED
+            and time.monotonic() - self.opened_at < self.reset_timeout
+        )
+
+    def allow(self) -> bool:
+        if not self.is_open:
+            if self.state != self.CLOSED:
+                # Пробный вызов. Если он потеряется (например, будет отменён),
+                # следующий пропустим ещё через reset_timeout
+                self.opened_at = time.monotonic()
+                self._set(self.HALF_OPEN)
+            return True
+        return False
+
+    def success(self):
+        self.failures = 0
+        if self.state != self.CLOSED:
+            logger.info(f"Circuit {self.name} closed")
+            self._set(self.CLOSED)
+
+    def failure(self):
+        self.failures += 1
+        if self.state == self.HALF_OPEN or self.failures >= self.failure_threshold:
+            if self.state != self.OPEN:
+                logger.warning(
+                    f"Circuit {self.name} opened after {self.failures} failures"
+                )
+            self.opened_at = time.monotonic()
+            self._set(self.OPEN)
+
+
+class Resilient:
+    """
+    Вызов зависимости с таймаутом на попытку, общим сроком (deadline),
+    повторами с полным джиттером и автоматом защиты.
+
+    transient решает, какие ошибки временные: только они повторяются и
+    считаются отказом зависимости. Остальные (например, 404) пробрасываются сразу
+    """
+
+    def __init__(
+        self,
+        breaker: CircuitBreaker,
+        transient: Callable[[BaseException], bool],
+        timeout: float,
+        deadline: float,
+        retries: int,
+        base_delay: float = 0.05,
+        max_delay: float = 1.0,
+    ):
+        self.breaker = breaker
+        self.transient = transient
+        self.timeout = timeout
+        self.deadline = deadline
+        self.retries = retries
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+
+    async def call(self, func: Callable[[], Awaitable[T]]) -> T:
+        deadline = time.monotonic() + self.deadline
+
+        for attempt in range(self.retries + 1):
+            if not self.breaker.allow():
+                raise ServiceUnavailable(f"{self.breaker.name} circuit is open")
+
+            left = deadline - time.monotonic()
+            try:
+                result = await asyncio.wait_for(func(), min(self.timeout, left))
+            except Exception as ex:
+                if not isinstance(ex, asyncio.TimeoutError) and not self.transient(ex):
+                    # Зависимость ответила, ошибка в самом запросе
+                    self.breaker.success()
+                    raise
+                self.breaker.failure()
+                error = ex
+            else:
+                self.breaker.success()
+                return result
+
+            # Полный джиттер: повторы разных запросов не приходят одной волной
+            delay = random.uniform(
+                0, min(self.max_delay, self.base_delay * 2**attempt)
+            )
+            if attempt == self.retries or time.monotonic() + delay >= deadline:
+                break
+            DEPENDENCY_RETRIES.labels(self.breaker.name).inc()
+            await asyncio.sleep(delay)
+
+        raise ServiceUnavailable(
+            f"{self.breaker.name} is unavailable: {error!r}"
+        ) from error
@@ -1,27 +1,53 @@
+import asyncio
 import sys
-from contextlib import asynccontextmanager
+from contextlib import asynccontextmanager, suppress
 
 from elasticsearch import AsyncElasticsearch
-from fastapi import FastAPI
+from fastapi import FastAPI, Request, Response
 from fastapi.responses import ORJSONResponse
+from prometheus_client import CONTENT_TYPE_LATEST, REGISTRY, generate_latest
 from redis.asyncio import Redis
 
 sys.path.append("/opt/app/src")
 
 from api.v1 import films, genres, persons
-from core.config import Settings
+from core.config import settings as config
+from core.metrics import MetricsMiddleware, ServiceCollector
+from core.resilience import ServiceUnavailable
 from db import elastic, redis
-
-config = Settings()
+from services.film import get_film_service
+from services.genre import get_genre_service
+from services.invalidation import listen_invalidations
+from services.person import get_person_service
 
 
 @asynccontextmanager
 async def lifespan(app: FastAPI):
     redis.redis = Redis(host=config.redis_host, port=config.redis_port)
+    # Повторы и таймауты задаются в сервисах (core.resilience), а не в клиенте
     elastic.es = AsyncElasticsearch(
-        hosts=[f"{config.elastic_host}:{config.elastic_port}"]
+        hosts=[f"{config.elastic_host}:{config.elastic_port}"], max_retries=0
     )
+
+    # Сервисы создаются так же, как в Depends, поэтому это те же экземпляры
+    services = {
+        service.index: service
+        for service in (
+            get_film_service(redis=redis.redis, elastic=elastic.es),
+            get_person_service(redis=redis.redis, elastic=elastic.es),
+            get_genre_service(redis=redis.redis, elastic=elastic.es),
+        )
+    }
+    invalidation = asyncio.create_task(listen_invalidations(redis.redis, services))
+    collector = ServiceCollector(services)
+    REGISTRY.register(collector)
+
     yield
+
+    REGISTRY.unregister(collector)
+    invalidation.cancel()
+    with suppress(asyncio.CancelledError):
+        await invalidation
     await redis.redis.close()
     await elastic.es.close()
 
@@ -42,3 +68,20 @@ app = FastAPI(
 app.include_router(films.router, prefix="/api/v1/films", tags=["Фильмы"])
 app.include_router(persons.router, prefix="/api/v1/persons", tags=["Персоны"])
 app.include_router(genres.router, prefix="/api/v1/genres", tags=["Жанры"])
+
+app.add_middleware(MetricsMiddleware, profiling=config.profiling_enabled)
+
+
+@app.exception_handler(ServiceUnavailable)
+async def service_unavailable(request: Request, ex: ServiceUnavailable) -> Response:
+    # Быстрый отказ вместо ожидания: клиент может повторить после Retry-After
+    return ORJSONResponse(
+        {"detail": "service temporarily unavailable"},
+        status_code=503,
+        headers={"Retry-After": str(int(config.breaker_reset_timeout))},
+    )
+
+
+@app.get("/metrics", include_in_schema=False)
+async def metrics() -> Response:
+    return Response(generate_latest(), media_type=CONTENT_TYPE_LATEST)
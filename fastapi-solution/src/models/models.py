@@ -6,13 +6,17 @@ from fastapi import Query
 
 # Используем pydantic для упрощения работы
 # при перегонке данных из json в объекты
-from pydantic import BaseModel
+from pydantic import BaseModel, Field
 
 
 class Base(BaseModel):
     id: UUID
 
 
+class BatchIds(BaseModel):
+    ids: list[str] = Field(min_length=1, max_length=100)
+
+
 class PersonShort(BaseModel):
     id: str
     name: str
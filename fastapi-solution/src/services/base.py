@@ -0,0 +1,517 @@
+import base64
+import hashlib
+import logging
+from functools import cache
+from typing import Awaitable, Callable, TypeVar
+
+import orjson
+from core.config import settings
+from core.metrics import (
+    CACHE_REQUESTS,
+    ES_SECONDS,
+    ES_TOOK_SECONDS,
+    REDIS_SECONDS,
+    SERIALIZE_SECONDS,
+)
+from core.resilience import CircuitBreaker, Resilient, ServiceUnavailable
+from elasticsearch import AsyncElasticsearch, NotFoundError, TransportError
+from elasticsearch import ConnectionError as ElasticConnectionError
+from pydantic import BaseModel
+from redis.asyncio import Redis
+from redis.exceptions import RedisError
+
+from services.cache import BackgroundRefresher, SingleFlight, TTLCache
+
+# Ответы на списки и поиск больше этого размера в кеш не кладём
+RESULT_CACHE_MAX_BYTES = 512 * 1024
+EMPTY_RESULT = b"[]"
+# Сколько запись живёт в Redis после мягкого TTL: в это время отдаётся
+# устаревшее значение, а свежее загружается в фоне
+STALE_CACHE_EXPIRE_IN_SECONDS = 60 * 60  # 1 час
+# Отметка об отсутствующем объекте и время её жизни
+TOMBSTONE = b""
+NEGATIVE_CACHE_EXPIRE_IN_SECONDS = 30
+# Ограничение Elasticsearch на from + size (index.max_result_window)
+MAX_RESULT_WINDOW = 10000
+# Ответы Elasticsearch, после которых запрос имеет смысл повторить
+ELASTIC_RETRY_STATUSES = {429, 502, 503, 504}
+
+T = TypeVar("T")
+
+logger = logging.getLogger(__name__)
+
+
+def elastic_transient(ex: BaseException) -> bool:
+    return isinstance(ex, ElasticConnectionError) or (
+        isinstance(ex, TransportError) and ex.status_code in ELASTIC_RETRY_STATUSES
+    )
+
+
+def redis_transient(ex: BaseException) -> bool:
+    return isinstance(ex, RedisError)
+
+
+# Автоматы защиты общие для всех сервисов воркера: зависимость одна на всех
+elastic_breaker = CircuitBreaker(
+    "elasticsearch", settings.breaker_failure_threshold, settings.breaker_reset_timeout
+)
+redis_breaker = CircuitBreaker(
+    "redis", settings.breaker_failure_threshold, settings.breaker_reset_timeout
+)
+
+
+class InvalidCursor(ValueError):
+    """Курсор следующей страницы повреждён, устарел или относится к другому запросу"""
+
+
+def es_pagination(page_number: int, page_count: int) -> tuple[int, int]:
+    number = min((page_number - 1) * page_count, MAX_RESULT_WINDOW)
+    count = min(page_count, MAX_RESULT_WINDOW - number)
+    return number, count
+
+
+def encode_cursor(state: dict) -> str:
+    return base64.urlsafe_b64encode(orjson.dumps(state)).decode()
+
+
+def decode_cursor(cursor: str) -> dict:
+    try:
+        state = orjson.loads(base64.urlsafe_b64decode(cursor.encode()))
+    except ValueError as ex:
+        raise InvalidCursor("malformed cursor") from ex
+
+    if not isinstance(state, dict) or not isinstance(state.get("after"), list):
+        raise InvalidCursor("malformed cursor")
+    return state
+
+
+def query_hash(body: dict) -> str:
+    """
+    Канонический хеш тела запроса к Elasticsearch: ключи сортируются,
+    поэтому одинаковые запросы дают одинаковый ключ кеша
+    """
+
+    return hashlib.sha1(orjson.dumps(body, option=orjson.OPT_SORT_KEYS)).hexdigest()
+
+
+@cache
+def schema_version(model: type[BaseModel]) -> str:
+    """
+    Короткий хеш json-схемы модели, используется как версия записей в кеше
+    """
+
+    schema = orjson.dumps(model.model_json_schema(), option=orjson.OPT_SORT_KEYS)
+    return hashlib.sha1(schema).hexdigest()[:8]
+
+
+class BaseService:
+    """
+    Общая логика получения документа по id: Redis -> Elasticsearch -> Redis
+    """
+
+    # Псевдоним индекса: за ним стоит текущая версия (movies_v1, movies_v2 и т.д.),
+    # которую полная переиндексация атомарно подменяет
+    index: str
+    cache_prefix: str
+    model: type[BaseModel]
+    # Мягкий TTL: после него запись считается устаревшей
+    cache_expire: int
+    cache_stale_expire: int = STALE_CACHE_EXPIRE_IN_SECONDS
+
+    def __init__(self, redis: Redis, elastic: AsyncElasticsearch):
+        self.redis = redis
+        self.elastic = elastic
+        self.single_flight = SingleFlight(
+            redis if settings.cache_redis_lock else None,
+            settings.cache_lock_timeout,
+            redis_breaker,
+        )
+        # L1-кеш перед Redis для самых популярных объектов
+        self.l1 = TTLCache(
+            settings.l1_cache_ttl,
+            settings.l1_cache_max_items,
+            settings.l1_cache_max_bytes,
+        )
+        self.refresher = BackgroundRefresher(settings.cache_refresh_concurrency)
+        # Счётчики попаданий в отметки об отсутствии объекта и их записи
+        self.tombstone_hits = 0
+        self.tombstones_stored = 0
+        # Поколение индекса входит в ключи кеша списков: ETL увеличивает его
+        # после каждой загрузки, и старые закешированные ответы перестают читаться
+        self.generation = 0
+        self.elastic_calls = Resilient(
+            elastic_breaker,
+            elastic_transient,
+            settings.elastic_timeout,
+            settings.elastic_deadline,
+            settings.elastic_retries,
+        )
+        self.redis_calls = Resilient(
+            redis_breaker,
+            redis_transient,
+            settings.redis_timeout,
+            settings.redis_deadline,
+            settings.redis_retries,
+        )
+
+    async def _elastic(self, operation: str, call: Callable[[], Awaitable[T]]) -> T:
+        """
+        Вызов Elasticsearch с таймаутом, повторами и автоматом защиты.
+        Если Elasticsearch недоступен, выбрасывается ServiceUnavailable
+        """
+
+        with ES_SECONDS.labels(self.index, operation).time():
+            return await self.elastic_calls.call(call)
+
+    async def _redis(
+        self, operation: str, call: Callable[[], Awaitable[T]], default: T = None
+    ) -> T:
+        """
+        Вызов Redis с таймаутом, повторами и автоматом защиты. Кеш не обязателен:
+        если Redis недоступен, возвращается default и запрос идёт в Elasticsearch
+        """
+
+        try:
+            with REDIS_SECONDS.labels(self.cache_prefix, operation).time():
+                return await self.redis_calls.call(call)
+        except ServiceUnavailable as ex:
+            # Без ошибки на каждый запрос: состояние Redis видно по метрике автомата
+            logger.debug(f"{self.cache_prefix}: cache {operation} skipped: {ex}")
+            return default
+
+    async def _get_with_ttl(self, key: str) -> tuple[bytes | None, int | None]:
+        # Значение вместе с оставшимся временем жизни: по нему проверяется мягкий TTL
+        async with self.redis.pipeline(transaction=False) as pipe:
+            return tuple(await pipe.get(key).pttl(key).execute())
+
+    async def _set_many(self, items: list[tuple[str, bytes, int]]):
+        # Пайплайн собирается на каждую попытку: после execute он очищается
+        async with self.redis.pipeline(transaction=False) as pipe:
+            for key, data, expire in items:
+                pipe.set(key, data, expire)
+            await pipe.execute()
+
+    def _refresh(self, key: str, refresh: Callable[[], Awaitable]):
+        # Пока Elasticsearch недоступен, устаревшие данные отдаются без попыток обновления
+        if not elastic_breaker.is_open:
+            self.refresher.schedule(key, refresh)
+
+    @property
+    def _hard_expire(self) -> int:
+        return self.cache_expire + self.cache_stale_expire
+
+    def _cache_key(self, item_id: str) -> str:
+        # Версия схемы в ключе: после изменения модели старые записи просто не читаются
+        return f"{self.cache_prefix}-{schema_version(self.model)}-{item_id}"
+
+    # get_by_id возвращает объект. Он опционален, так как объект может отсутствовать в базе
+    async def get_by_id(self, item_id: str) -> BaseModel | None:
+        data = await self.get_raw_by_id(item_id)
+        if data is None:
+            return None
+
+        # pydantic предоставляет удобное API для создания объекта моделей из json
+        return self.model.model_validate_json(data)
+
+    async def get_raw_by_id(self, item_id: str) -> bytes | None:
+        """
+        Возвращает json объекта в том виде, в котором он лежит в кеше.
+        Схема json совпадает со схемой модели за счёт версии в ключе кеша
+        """
+
+        # Пытаемся получить данные из кеша, потому что оно работает быстрее
+        data = await self._from_cache(item_id)
+        if data is None:
+            # Если объекта нет в кеше, то ищем его в Elasticsearch.
+            # Конкурентные промахи по одному ключу схлопываются в один запрос
+            data = await self.single_flight.do(
+                self._cache_key(item_id),
+                lambda: self._load(item_id),
+                lambda: self._from_cache(item_id),
+            )
+        elif data == TOMBSTONE:
+            self.tombstone_hits += 1
+
+        return None if data == TOMBSTONE else data
+
+    async def _load(self, item_id: str) -> bytes:
+        item = await self._get_from_elastic(item_id)
+        if not item:
+            # Если он отсутствует в Elasticsearch, значит, объекта вообще нет в базе.
+            # Запоминаем это ненадолго, чтобы повторные запросы не шли в Elasticsearch
+            key = self._cache_key(item_id)
+            await self._redis(
+                "set",
+                lambda: self.redis.set(key, TOMBSTONE, NEGATIVE_CACHE_EXPIRE_IN_SECONDS),
+            )
+            self._remember(key, TOMBSTONE)
+            self.tombstones_stored += 1
+            return TOMBSTONE
+        # Сохраняем объект в кеш
+        return await self._put_to_cache(item)
+
+    def _remember(self, key: str, data: bytes):
+        # Отметка об отсутствии объекта тоже занимает память, учитываем её по длине ключа
+        self.l1.set(key, data, len(data) or len(key))
+
+    async def _get_from_elastic(self, item_id: str) -> BaseModel | None:
+        try:
+            doc = await self._elastic(
+                "get", lambda: self.elastic.get(index=self.index, id=item_id)
+            )
+        except NotFoundError:
+            return None
+        return self.model(**doc["_source"])
+
+    async def _from_cache(self, item_id: str) -> bytes | None:
+        key = self._cache_key(item_id)
+        # Сначала смотрим в L1-кеш воркера: это не требует похода в сеть
+        data = self.l1.get(key)
+        if data is not None:
+            return data
+
+        # Пытаемся получить данные из кеша, используя команду get, вместе с
+        # оставшимся временем жизни: по нему проверяется мягкий TTL
+        # https://redis.io/commands/get/
+        data, ttl = await self._redis(
+            "get", lambda: self._get_with_ttl(key), (None, None)
+        )
+        if data is None:
+            CACHE_REQUESTS.labels(self.cache_prefix, "redis", "miss").inc()
+            return None
+
+        if data != TOMBSTONE and 0 <= ttl < self.cache_stale_expire * 1000:
+            # Запись устарела: отдаём её сразу, а свежую версию загружаем в фоне
+            CACHE_REQUESTS.labels(self.cache_prefix, "redis", "stale").inc()
+            self._refresh(key, lambda: self._load(item_id))
+        else:
+            CACHE_REQUESTS.labels(self.cache_prefix, "redis", "hit").inc()
+            self._remember(key, data)
+        return data
+
+    async def _put_to_cache(self, item: BaseModel) -> bytes:
+        # Сохраняем данные, используя команду set
+        # https://redis.io/commands/set/
+        # Модель уже провалидирована, поэтому сериализуем её сразу в байты ответа
+        key = self._cache_key(item.id)
+        with SERIALIZE_SECONDS.labels(self.model.__name__).time():
+            data = orjson.dumps(item.model_dump())
+        await self._redis("set", lambda: self.redis.set(key, data, self._hard_expire))
+        self._remember(key, data)
+        return data
+
+    async def invalidate(self, item_ids: list[str], generation: int | None = None):
+        """
+        Удаляет объекты из L1 и Redis после их переиндексации в ETL
+        """
+
+        keys = [self._cache_key(item_id) for item_id in item_ids]
+        for key in keys:
+            self.l1.delete(key)
+        if keys:
+            await self.redis.delete(*keys)
+
+        if generation is not None:
+            self.generation = max(self.generation, generation)
+
+    async def get_many_raw(self, item_ids: list[str]) -> bytes:
+        """
+        Пакетное получение объектов в виде json-массива: один MGET в Redis,
+        один mget в Elasticsearch для промахов и пайплайн SET для записи в кеш.
+        Порядок соответствует item_ids, отсутствующие объекты пропускаются
+        и запоминаются так же, как в get_raw_by_id
+        """
+
+        item_ids = list(dict.fromkeys(item_ids))
+        found: dict[str, bytes] = {}
+
+        for item_id in item_ids:
+            data = self.l1.get(self._cache_key(item_id))
+            if data is not None:
+                found[item_id] = data
+
+        l1_hits = len(found)
+
+        missing = [item_id for item_id in item_ids if item_id not in found]
+        if missing:
+            values = await self._redis(
+                "mget",
+                lambda: self.redis.mget([self._cache_key(i) for i in missing]),
+                [None] * len(missing),
+            )
+            for item_id, data in zip(missing, values):
+                if data is not None:
+                    found[item_id] = data
+                    self._remember(self._cache_key(item_id), data)
+
+        missing = [item_id for item_id in item_ids if item_id not in found]
+        CACHE_REQUESTS.labels(self.cache_prefix, "redis", "hit").inc(len(found) - l1_hits)
+        if missing:
+            CACHE_REQUESTS.labels(self.cache_prefix, "redis", "miss").inc(len(missing))
+            found |= await self._load_many(missing)
+
+        return b"[" + b",".join(found[i] for i in item_ids if found.get(i)) + b"]"
+
+    async def _load_many(self, item_ids: list[str]) -> dict[str, bytes]:
+        result = await self._elastic(
+            "mget", lambda: self.elastic.mget(index=self.index, body={"ids": item_ids})
+        )
+        loaded = {}
+        items = []
+
+        for doc in result["docs"]:
+            key = self._cache_key(doc["_id"])
+            if doc.get("found"):
+                with SERIALIZE_SECONDS.labels(self.model.__name__).time():
+                    data = orjson.dumps(self.model(**doc["_source"]).model_dump())
+                items.append((key, data, self._hard_expire))
+            else:
+                data = TOMBSTONE
+                items.append((key, data, NEGATIVE_CACHE_EXPIRE_IN_SECONDS))
+                self.tombstones_stored += 1
+            self._remember(key, data)
+            loaded[doc["_id"]] = data
+
+        if items:
+            await self._redis("set_many", lambda: self._set_many(items))
+
+        return loaded
+
+    async def _search_page(
+        self,
+        body: dict,
+        expire: int,
+        serialize: Callable[[list[dict]], bytes],
+        cursor: str | None = None,
+    ) -> tuple[bytes, str | None]:
+        """
+        Страница списка и курсор следующей страницы.
+
+        Без курсора используется from/size, с курсором — search_after, поэтому
+        глубокие страницы стоят столько же, сколько первая и не упираются в 10000.
+        Если задан es_pit_keep_alive, страницы по курсору читаются из point-in-time
+        """
+
+        # Тай-брейкер по id делает порядок однозначным, по нему строится search_after.
+        # Без явной сортировки порядок по релевантности, иначе поиск по тексту
+        # выдавал бы совпадения в порядке id
+        body["sort"] = [*(body.get("sort") or ["_score"]), {"id": "asc"}]
+        query_id = query_hash({k: v for k, v in body.items() if k not in ("from", "size")})
+
+        pit = None
+        if cursor:
+            state = decode_cursor(cursor)
+            if state.get("query") != query_id:
+                raise InvalidCursor("cursor does not match query")
+            body.pop("from", None)
+            body["search_after"] = state["after"]
+            pit = state.get("pit")
+            if pit is None and settings.es_pit_keep_alive:
+                opened = await self._elastic(
+                    "open_pit",
+                    lambda: self.elastic.open_point_in_time(
+                        index=self.index, keep_alive=settings.es_pit_keep_alive
+                    ),
+                )
+                pit = opened["id"]
+
+        if pit:
+            # Снимок индекса уникален для клиента, такие страницы не кешируем
+            body["pit"] = {"id": pit, "keep_alive": settings.es_pit_keep_alive}
+            try:
+                result = await self._search(body, pit=True)
+            except NotFoundError as ex:
+                raise InvalidCursor("cursor expired") from ex
+            pit = result.get("pit_id", pit)
+            hits = result["hits"]["hits"]
+            data, last_sort = serialize(hits), self._last_sort(hits, body["size"])
+        else:
+            data, last_sort = await self._search_cached(body, expire, serialize)
+
+        if last_sort is None:
+            return data, None
+
+        state = {"query": query_id, "after": last_sort}
+        if pit:
+            state["pit"] = pit
+        return data, encode_cursor(state)
+
+    async def _search_cached(
+        self, body: dict, expire: int, serialize: Callable[[list[dict]], bytes]
+    ) -> tuple[bytes, list | None]:
+        """
+        Поиск в Elasticsearch с кешированием готового json-ответа в Redis.
+        При попадании в кеш не выполняются ни запрос к Elasticsearch, ни pydantic.
+        Вместе с ответом хранится sort последнего документа для search_after.
+        Как и объекты, устаревший ответ отдаётся сразу и обновляется в фоне
+        """
+
+        key = f"{self.cache_prefix}-query-{self.generation}-{query_hash(body)}"
+        cached, ttl = await self._redis(
+            "get_query", lambda: self._get_with_ttl(key), (None, None)
+        )
+        if cached is not None:
+            if 0 <= ttl < self.cache_stale_expire * 1000:
+                CACHE_REQUESTS.labels(self.cache_prefix, "query", "stale").inc()
+                self._refresh(
+                    key, lambda: self._search_to_cache(key, body, expire, serialize)
+                )
+            else:
+                CACHE_REQUESTS.labels(self.cache_prefix, "query", "hit").inc()
+            # json от orjson не содержит переводов строк, поэтому разделитель однозначен
+            last_sort, data = cached.split(b"\n", 1)
+            return data, orjson.loads(last_sort)
+
+        CACHE_REQUESTS.labels(self.cache_prefix, "query", "miss").inc()
+        return await self._search_to_cache(key, body, expire, serialize)
+
+    async def _search_to_cache(
+        self,
+        key: str,
+        body: dict,
+        expire: int,
+        serialize: Callable[[list[dict]], bytes],
+    ) -> tuple[bytes, list | None]:
+        result = await self._search(body)
+        hits = result["hits"]["hits"]
+        with SERIALIZE_SECONDS.labels(self.model.__name__).time():
+            data = serialize(hits)
+        last_sort = self._last_sort(hits, body.get("size"))
+        if len(data) <= RESULT_CACHE_MAX_BYTES:
+            value = orjson.dumps(last_sort) + b"\n" + data
+            await self._redis(
+                "set_query",
+                lambda: self.redis.set(key, value, expire + self.cache_stale_expire),
+            )
+
+        return data, last_sort
+
+    async def _search(self, body: dict, pit: bool = False) -> dict:
+        """
+        Поиск с замером времени на стороне клиента и на стороне Elasticsearch (took):
+        разница между ними — сеть, очередь запросов и разбор ответа
+        """
+
+        if pit:
+            # С point-in-time индекс задаётся снимком, а не в пути запроса
+            result = await self._elastic("search", lambda: self.elastic.search(body=body))
+        else:
+            result = await self._elastic(
+                "search", lambda: self.elastic.search(index=self.index, body=body)
+            )
+        ES_TOOK_SECONDS.labels(self.index, "search").observe(result["took"] / 1000)
+        return result
+
+    @staticmethod
+    def _last_sort(hits: list[dict], size: int | None) -> list | None:
+        # Неполная страница — последняя, курсор дальше не нужен
+        if not hits or len(hits) != size or "sort" not in hits[-1]:
+            return None
+        return hits[-1]["sort"]
+
+    def _serialize_models(self, hits: list[dict]) -> bytes:
+        return orjson.dumps([self.model(**doc["_source"]).model_dump() for doc in hits])
+
+    @staticmethod
+    def _serialize_sources(hits: list[dict]) -> bytes:
+        return orjson.dumps([doc["_source"] for doc in hits])
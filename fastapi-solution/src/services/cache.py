@@ -0,0 +1,190 @@
+import asyncio
+import logging
+import time
+from collections import OrderedDict
+from contextlib import suppress
+from typing import Any, Awaitable, Callable
+
+from core.resilience import CircuitBreaker
+from redis.asyncio import Redis
+from redis.exceptions import RedisError
+
+# Как часто воркер, не получивший блокировку, заглядывает в кеш
+LOCK_POLL_INTERVAL_IN_SECONDS = 0.05
+
+logger = logging.getLogger(__name__)
+
+
+class SingleFlight:
+    """
+    Схлопывание конкурентных промахов кеша.
+
+    Пока загрузка по ключу выполняется, остальные запросы с тем же ключом
+    не идут в Elasticsearch, а ждут результат первой загрузки.
+    Внутри воркера это делается через общую asyncio-задачу, между воркерами
+    (если передан redis) — через блокировку в Redis.
+    Если Redis недоступен (ошибка или разомкнутый breaker), загрузка
+    выполняется без блокировки, как обычный промах кеша.
+    """
+
+    def __init__(
+        self,
+        redis: Redis | None = None,
+        lock_timeout: float = 5.0,
+        breaker: CircuitBreaker | None = None,
+    ):
+        self.redis = redis
+        self.lock_timeout = lock_timeout
+        self.breaker = breaker
+        self.coalesced = 0
+        self._calls: dict[str, asyncio.Task] = {}
+
+    async def do(
+        self,
+        key: str,
+        load: Callable[[], Awaitable[Any]],
+        recheck: Callable[[], Awaitable[Any]],
+    ) -> Any:
+        """
+        Выполняет load один раз на ключ, остальные вызовы получают тот же результат.
+        recheck — повторная проверка кеша, пока загрузку выполняет другой воркер.
+        """
+
+        task = self._calls.get(key)
+        if task is not None:
+            self.coalesced += 1
+        else:
+            task = asyncio.create_task(self._run(key, load, recheck))
+            self._calls[key] = task
+            task.add_done_callback(lambda _: self._calls.pop(key, None))
+
+        # shield: отмена одного из ожидающих запросов не отменяет общую загрузку
+        return await asyncio.shield(task)
+
+    async def _run(self, key, load, recheck):
+        if self.redis is None or (self.breaker and self.breaker.is_open):
+            return await load()
+
+        lock = self.redis.lock(
+            f"lock-{key}", timeout=self.lock_timeout, blocking=False
+        )
+        try:
+            acquired = await lock.acquire()
+        except RedisError as ex:
+            # Без Redis схлопывание между воркерами невозможно, грузим сами
+            logger.warning(f"Cache lock {key} is unavailable: {ex}")
+            return await load()
+
+        if acquired:
+            try:
+                return await load()
+            finally:
+                # LockError — тоже RedisError. Блокировку, которую не удалось
+                # снять, Redis удалит сам по истечении lock_timeout
+                with suppress(RedisError):
+                    await lock.release()
+
+        # Загрузку уже выполняет другой воркер: ждём, пока значение появится в кеше
+        self.coalesced += 1
+        loop = asyncio.get_running_loop()
+        deadline = loop.time() + self.lock_timeout
+        while loop.time() < deadline:
+            await asyncio.sleep(LOCK_POLL_INTERVAL_IN_SECONDS)
+            result = await recheck()
+            if result is not None:
+                return result
+            try:
+                if not await lock.locked():
+                    break
+            except RedisError as ex:
+                # Redis пропал во время ожидания: не отдаём 500, грузим сами
+                logger.warning(f"Cache lock {key} is unavailable: {ex}")
+                break
+
+        return await load()
+
+
+class BackgroundRefresher:
+    """
+    Фоновое обновление устаревших записей кеша (stale-while-revalidate).
+
+    Одна и та же запись обновляется не более одного раза одновременно,
+    количество одновременно выполняемых обновлений ограничено.
+    """
+
+    def __init__(self, concurrency: int):
+        self.refreshed = 0
+        self._semaphore = asyncio.Semaphore(concurrency)
+        self._pending: dict[str, asyncio.Task] = {}
+
+    def schedule(self, key: str, refresh: Callable[[], Awaitable[Any]]):
+        if key in self._pending:
+            return
+
+        task = asyncio.create_task(self._run(refresh))
+        self._pending[key] = task
+        task.add_done_callback(lambda _: self._pending.pop(key, None))
+
+    async def _run(self, refresh):
+        async with self._semaphore:
+            try:
+                await refresh()
+                self.refreshed += 1
+            except Exception as ex:
+                # Ошибка обновления не должна ронять запрос: устаревшее значение уже отдано
+                logger.error(f"Background cache refresh failed: {ex}")
+
+
+class TTLCache:
+    """
+    In-process (L1) кеш воркера с TTL и LRU-вытеснением.
+
+    Ограничен количеством элементов и суммарным размером значений в байтах,
+    размер значения передаётся вызывающим (обычно длина json из Redis).
+    """
+
+    def __init__(self, ttl: float, max_items: int, max_bytes: int):
+        self.ttl = ttl
+        self.max_items = max_items
+        self.max_bytes = max_bytes
+        self.size = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self._data: OrderedDict[str, tuple[float, int, Any]] = OrderedDict()
+
+    def __len__(self) -> int:
+        return len(self._data)
+
+    def get(self, key: str) -> Any:
+        entry = self._data.get(key)
+        if entry is None or entry[0] < time.monotonic():
+            if entry is not None:
+                self._remove(key)
+            self.misses += 1
+            return None
+
+        self._data.move_to_end(key)
+        self.hits += 1
+        return entry[2]
+
+    def set(self, key: str, value: Any, size: int):
+        if size > self.max_bytes:
+            return
+
+        self.delete(key)
+        self._data[key] = (time.monotonic() + self.ttl, size, value)
+        self.size += size
+
+        while len(self._data) > self.max_items or self.size > self.max_bytes:
+            _, (_, evicted_size, _) = self._data.popitem(last=False)
+            self.size -= evicted_size
+            self.evictions += 1
+
+    def delete(self, key: str):
+        if key in self._data:
+            self._remove(key)
+
+    def _remove(self, key: str):
+        _, size, _ = self._data.pop(key)
+        self.size -= size
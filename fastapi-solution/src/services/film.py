@@ -6,68 +6,24 @@ from elasticsearch import AsyncElasticsearch, NotFoundError
 from fastapi import Depends
 from models.models import Film, MultiParams
 from redis.asyncio import Redis
+from services.base import EMPTY_RESULT, BaseService, es_pagination
 
 from models.models import QueryParams
 
 FILM_CACHE_EXPIRE_IN_SECONDS = 60 * 5  # 5 минут
+FILM_LIST_CACHE_EXPIRE_IN_SECONDS = 60  # 1 минута
+FILM_SEARCH_CACHE_EXPIRE_IN_SECONDS = 60 * 2  # 2 минуты
 
 
-def es_pagination(page_number: int, page_count: int) -> tuple[int, int]:
-    number = min((page_number - 1) * page_count, 10000)
-    count = min(page_count, 10000 - number)
-    return number, count
+class FilmService(BaseService):
+    index = "movies"
+    cache_prefix = "movies"
+    model = Film
+    cache_expire = FILM_CACHE_EXPIRE_IN_SECONDS
 
-
-class FilmService:
-    def __init__(self, redis: Redis, elastic: AsyncElasticsearch):
-        self.redis = redis
-        self.elastic = elastic
-
-    # get_by_id возвращает объект фильма. Он опционален, так как фильм может отсутствовать в базе
-    async def get_by_id(self, film_id: str) -> Film | None:
-        # Пытаемся получить данные из кеша, потому что оно работает быстрее
-        film = await self._film_from_cache(film_id)
-        if not film:
-            # Если фильма нет в кеше, то ищем его в Elasticsearch
-            film = await self._get_film_from_elastic(film_id)
-            if not film:
-                # Если он отсутствует в Elasticsearch, значит, фильма вообще нет в базе
-                return None
-            # Сохраняем фильм  в кеш
-            await self._put_film_to_cache(film)
-
-        return film
-
-    async def _get_film_from_elastic(self, film_id: str) -> Film | None:
-        try:
-            doc = await self.elastic.get(index="movies", id=film_id)
-        except NotFoundError:
-            return None
-        return Film(**doc["_source"])
-
-    async def _film_from_cache(self, film_id: str) -> Film | None:
-        # Пытаемся получить данные о фильме из кеша, используя команду get
-        # https://redis.io/commands/get/
-        data = await self.redis.get(f"movies-{film_id}")
-        if not data:
-            return None
-
-        # pydantic предоставляет удобное API для создания объекта моделей из json
-        film = Film.parse_raw(data)
-        return film
-
-    async def _put_film_to_cache(self, film: Film):
-        # Сохраняем данные о фильме, используя команду set
-        # Выставляем время жизни кеша — 5 минут
-        # https://redis.io/commands/set/
-        # pydantic позволяет сериализовать модель в json
-        await self.redis.set(
-            f"movies-{film.id}", film.model_dump_json(), FILM_CACHE_EXPIRE_IN_SECONDS
-        )
-
-    async def search_films(self, query: QueryParams) -> list[Film] | None:
+    async def search_films(self, query: QueryParams) -> bytes | None:
         """
-        Полнотекстовый поиск фильмов по query
+        Полнотекстовый поиск фильмов по query, возвращает готовый json
         """
 
         body = {
@@ -86,13 +42,14 @@ class FilmService:
             }
 
         try:
-
-            data = await self.elastic.search(index="movies", body=body)
-            return [item["_source"] for item in data["hits"]["hits"]]
-
+            data, _ = await self._search_cached(
+                body, FILM_SEARCH_CACHE_EXPIRE_IN_SECONDS, self._serialize_sources
+            )
         except NotFoundError:
             return None
 
+        return None if data == EMPTY_RESULT else data
+
     async def get_list(
         self,
         title: str,
@@ -102,14 +59,20 @@ class FilmService:
         multi_params: MultiParams | None,
         page_number: int,
         page_count: int,
-    ) -> list[Film]:
+        cursor: str | None = None,
+    ) -> tuple[bytes, str | None]:
         """
-        Получаем данные фильмов с возможностью фильтрации и сортировки
+        Получаем данные фильмов с возможностью фильтрации и сортировки в виде готового json.
+        Вместе со страницей возвращается курсор следующей страницы
         """
 
         search_from, search_size = es_pagination(page_number, page_count)
+        if cursor:
+            # С курсором номер страницы не используется, но размер страницы
+            # всё так же ограничен max_result_window
+            search_from, search_size = es_pagination(1, page_count)
         if not search_size:
-            return []
+            return EMPTY_RESULT, None
 
         sort = []
 
@@ -130,17 +93,19 @@ class FilmService:
         if title:
             query["bool"]["must"].append({"match": {"title": title}})
 
+        # Фильтры сортируем и убираем повторы, чтобы одинаковые по смыслу
+        # запросы попадали в один ключ кеша
         if genre:
-            for g in genre:
-                query["bool"]["must"].append({"match": {"genre": g.value}})
+            for g in sorted({g.value for g in genre}):
+                query["bool"]["must"].append({"match": {"genre": g}})
 
         if multi_params:
             if multi_params.writers:
-                for writer in multi_params.writers:
+                for writer in sorted(set(multi_params.writers)):
                     query["bool"]["must"].append({"match": {"writers.id": writer}})
 
             if multi_params.actors:
-                for actor in multi_params.actors:
+                for actor in sorted(set(multi_params.actors)):
                     query["bool"]["must"].append({"match": {"actors.id": actor}})
 
         if director:
@@ -156,13 +121,10 @@ class FilmService:
         if query:
             body["query"] = query
 
-        films_search = await self.elastic.search(
-            body=body,
-            index="movies",
+        return await self._search_page(
+            body, FILM_LIST_CACHE_EXPIRE_IN_SECONDS, self._serialize_models, cursor
         )
 
-        return [Film(**doc["_source"]) for doc in films_search["hits"]["hits"]]
-
 
 @lru_cache()
 def get_film_service(
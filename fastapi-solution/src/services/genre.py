@@ -2,68 +2,41 @@ from functools import lru_cache
 
 from db.elastic import get_elastic
 from db.redis import get_redis
-from elasticsearch import AsyncElasticsearch, NotFoundError
+from elasticsearch import AsyncElasticsearch
 from fastapi import Depends
 from models.models import Genre
 from redis.asyncio import Redis
+from services.base import EMPTY_RESULT, BaseService, es_pagination
 
 GENRE_CACHE_EXPIRE_IN_SECONDS = 60 * 5  # 5 минут
+GENRE_LIST_CACHE_EXPIRE_IN_SECONDS = 60 * 5  # 5 минут
 
 
-def es_pagination(page_number: int, page_count: int) -> tuple[int, int]:
-    number = min((page_number - 1) * page_count, 10000)
-    count = min(page_count, 10000 - number)
-    return number, count
-
-
-class GenreService:
-    def __init__(self, redis: Redis, elastic: AsyncElasticsearch):
-        self.redis = redis
-        self.elastic = elastic
-
-    async def get_by_id(self, genre_id: str) -> Genre | None:
-        genre = await self._genre_from_cache(genre_id)
-        if not genre:
-            genre = await self._get_genre_from_elastic(genre_id)
-            if not genre:
-                return None
-            await self._put_genre_to_cache(genre)
-
-        return genre
-
-    async def _get_genre_from_elastic(self, genre_id: str) -> Genre | None:
-        try:
-            doc = await self.elastic.get(index="genres", id=genre_id)
-        except NotFoundError:
-            return None
-        return Genre(**doc["_source"])
-
-    async def _genre_from_cache(self, genre_id: str) -> Genre | None:
-        data = await self.redis.get(f"genre-{genre_id}")
-        if not data:
-            return None
-
-        genre = Genre.parse_raw(data)
-        return genre
-
-    async def _put_genre_to_cache(self, genre: Genre):
-        await self.redis.set(
-            f"genre-{genre.id}", genre.model_dump_json(), GENRE_CACHE_EXPIRE_IN_SECONDS
-        )
+class GenreService(BaseService):
+    index = "genres"
+    cache_prefix = "genre"
+    model = Genre
+    cache_expire = GENRE_CACHE_EXPIRE_IN_SECONDS
 
     async def get_list(
         self,
         name: str,
         page_number: int,
         page_count: int,
-    ) -> list[Genre]:
+        cursor: str | None = None,
+    ) -> tuple[bytes, str | None]:
         """
-        Получаем данные жанров с возможностью фильтрации и сортировки
+        Получаем данные жанров с возможностью фильтрации и сортировки в виде готового json.
+        Вместе со страницей возвращается курсор следующей страницы
         """
 
         search_from, search_size = es_pagination(page_number, page_count)
+        if cursor:
+            # С курсором номер страницы не используется, но размер страницы
+            # всё так же ограничен max_result_window
+            search_from, search_size = es_pagination(1, page_count)
         if not search_size:
-            return []
+            return EMPTY_RESULT, None
 
         query = {
             "bool": {
@@ -84,13 +57,10 @@ class GenreService:
         if query:
             body["query"] = query
 
-        genre_search = await self.elastic.search(
-            body=body,
-            index="genres",
+        return await self._search_page(
+            body, GENRE_LIST_CACHE_EXPIRE_IN_SECONDS, self._serialize_models, cursor
         )
 
-        return [Genre(**doc["_source"]) for doc in genre_search["hits"]["hits"]]
-
 
 @lru_cache()
 def get_genre_service(
@@ -0,0 +1,53 @@
+import asyncio
+import logging
+
+import orjson
+from core.config import settings
+from redis.asyncio import Redis
+from redis.exceptions import RedisError
+
+from services.base import BaseService
+
+# Пауза перед переподключением к Redis после ошибки
+RECONNECT_DELAY_IN_SECONDS = 1
+
+logger = logging.getLogger(__name__)
+
+
+def generation_key(index: str) -> str:
+    # Ключ счётчика поколений, его увеличивает postgres_to_es
+    return f"cache-gen-{index}"
+
+
+async def load_generations(redis: Redis, services: dict[str, BaseService]):
+    values = await redis.mget([generation_key(index) for index in services])
+    for service, value in zip(services.values(), values):
+        service.generation = int(value or 0)
+
+
+async def listen_invalidations(redis: Redis, services: dict[str, BaseService]):
+    """
+    Подписка на изменения от ETL: сообщения вида
+    {"index": "movies", "ids": [...], "generation": 42}
+    """
+
+    while True:
+        try:
+            async with redis.pubsub() as pubsub:
+                await pubsub.subscribe(settings.cache_invalidation_channel)
+                # Пока не были подписаны, изменения могли пройти мимо
+                await load_generations(redis, services)
+
+                async for message in pubsub.listen():
+                    if message["type"] != "message":
+                        continue
+
+                    payload = orjson.loads(message["data"])
+                    service = services.get(payload["index"])
+                    if service is not None:
+                        await service.invalidate(
+                            payload["ids"], payload.get("generation")
+                        )
+        except RedisError as ex:
+            logger.error(f"Cache invalidation listener failed: {ex}")
+            await asyncio.sleep(RECONNECT_DELAY_IN_SECONDS)
@@ -6,68 +6,40 @@ from elasticsearch import AsyncElasticsearch, NotFoundError
 from fastapi import Depends
 from models.models import Person
 from redis.asyncio import Redis
+from services.base import EMPTY_RESULT, BaseService, es_pagination
 
 from models.models import QueryParams
 
 PERSON_CACHE_EXPIRE_IN_SECONDS = 60 * 5  # 5 минут
+PERSON_LIST_CACHE_EXPIRE_IN_SECONDS = 60  # 1 минута
+PERSON_SEARCH_CACHE_EXPIRE_IN_SECONDS = 60 * 2  # 2 минуты
 
 
-def es_pagination(page_number: int, page_count: int) -> tuple[int, int]:
-    number = min((page_number - 1) * page_count, 10000)
-    count = min(page_count, 10000 - number)
-    return number, count
-
-
-class PersonService:
-    def __init__(self, redis: Redis, elastic: AsyncElasticsearch):
-        self.redis = redis
-        self.elastic = elastic
-
-    async def get_by_id(self, person_id: str) -> Person | None:
-        person = await self._person_from_cache(person_id)
-        if not person:
-            person = await self._get_person_from_elastic(person_id)
-            if not person:
-                return None
-            await self._put_person_to_cache(person)
-
-        return person
-
-    async def _get_person_from_elastic(self, person_id: str) -> Person | None:
-        try:
-            doc = await self.elastic.get(index="persons", id=person_id)
-        except NotFoundError:
-            return None
-        return Person(**doc["_source"])
-
-    async def _person_from_cache(self, person_id: str) -> Person | None:
-        data = await self.redis.get(f"person-{person_id}")
-        if not data:
-            return None
-
-        person = Person.parse_raw(data)
-        return person
-
-    async def _put_person_to_cache(self, person: Person):
-        await self.redis.set(
-            f"person-{person.id}",
-            person.model_dump_json(),
-            PERSON_CACHE_EXPIRE_IN_SECONDS,
-        )
+class PersonService(BaseService):
+    index = "persons"
+    cache_prefix = "person"
+    model = Person
+    cache_expire = PERSON_CACHE_EXPIRE_IN_SECONDS
 
     async def get_list(
         self,
         full_name: str,
         page_number: int,
         page_count: int,
-    ) -> list[Person]:
+        cursor: str | None = None,
+    ) -> tuple[bytes, str | None]:
         """
-        Получаем данные персон с возможностью фильтрации и сортировки
+        Получаем данные персон с возможностью фильтрации и сортировки в виде готового json.
+        Вместе со страницей возвращается курсор следующей страницы
         """
 
         search_from, search_size = es_pagination(page_number, page_count)
+        if cursor:
+            # С курсором номер страницы не используется, но размер страницы
+            # всё так же ограничен max_result_window
+            search_from, search_size = es_pagination(1, page_count)
         if not search_size:
-            return []
+            return EMPTY_RESULT, None
 
         query = {
             "bool": {
@@ -88,16 +60,13 @@ class PersonService:
         if query:
             body["query"] = query
 
-        films_search = await self.elastic.search(
-            body=body,
-            index="persons",
+        return await self._search_page(
+            body, PERSON_LIST_CACHE_EXPIRE_IN_SECONDS, self._serialize_models, cursor
         )
 
-        return [Person(**doc["_source"]) for doc in films_search["hits"]["hits"]]
-
-    async def search_persons(self, query: QueryParams) -> list[Person] | None:
+    async def search_persons(self, query: QueryParams) -> bytes | None:
         """
-        Полнотекстовый поиск персон по query
+        Полнотекстовый поиск персон по query, возвращает готовый json
         """
 
         body = {
@@ -116,13 +85,14 @@ class PersonService:
             }
 
         try:
-
-            data = await self.elastic.search(index="persons", body=body)
-            return [item["_source"] for item in data["hits"]["hits"]]
-
+            data, _ = await self._search_cached(
+                body, PERSON_SEARCH_CACHE_EXPIRE_IN_SECONDS, self._serialize_sources
+            )
         except NotFoundError:
             return None
 
+        return None if data == EMPTY_RESULT else data
+
 
 @lru_cache()
 def get_person_service(
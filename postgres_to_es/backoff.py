@@ -1,11 +1,18 @@
 import logging
+import random
 import time
 from functools import wraps
 
+from metrics import RETRIES
+
 
 def backoff(start_sleep_time, factor, border_sleep_time):
     """
-    Функция для повторного выполнения функции через некоторое время, если возникла ошибка. Использует наивный экспоненциальный рост времени повтора (factor) до граничного времени ожидания (border_sleep_time)
+    Функция для повторного выполнения функции через некоторое время, если возникла ошибка. Использует экспоненциальный рост времени повтора (factor) до граничного времени ожидания (border_sleep_time)
+
+    Первая попытка выполняется сразу, пауза делается только после ошибки.
+    Фактическая пауза выбирается случайно от 0 до t (полный джиттер), чтобы
+    потоки и процессы, упавшие одновременно, не повторяли запросы одной волной.
 
     Формула:
         t = start_sleep_time * (factor ^ n), если t < border_sleep_time
@@ -24,16 +31,17 @@ def backoff(start_sleep_time, factor, border_sleep_time):
 
             while True:
                 try:
-                    time.sleep(t)
-                    result = func(*args, **kwargs)
-                    break
+                    return func(*args, **kwargs)
                 except Exception as ex:
-                    logging.error(f"{ex}. Attempt: {counter}. Wait: {t} sec.")
-                    t = min(t * 2**factor, border_sleep_time)
+                    delay = random.uniform(0, t)
+                    logging.error(
+                        f"{ex}. Attempt: {counter}. Wait: {delay:.2f} sec."
+                    )
+                    RETRIES.labels(func.__qualname__).inc()
+                    time.sleep(delay)
+                    t = min(t * factor, border_sleep_time)
                     counter += 1
 
-            return result
-
         return wrapper
 
     return decorator
@@ -0,0 +1,140 @@
+"""
+Локальная замена ELK для замеров: принимает _bulk, ничего не индексирует.
+
+Задержка ответа и доля документов, отклоняемых с 429, настраиваются,
+чтобы проверять поведение загрузчика под нагрузкой и при перегрузке.
+
+Запуск из каталога postgres_to_es:
+    python -m benchmark.es_stub --port 9201 --latency 0.02 --reject 0.05
+"""
+
+import argparse
+import gzip
+import logging
+import random
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import orjson
+
+
+class BulkStats:
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.requests = 0
+        self.docs = 0
+        self.rejected = 0
+        self.bytes = 0
+
+    def as_dict(self) -> dict:
+        with self.lock:
+            return {
+                "requests": self.requests,
+                "docs": self.docs,
+                "rejected": self.rejected,
+                "bytes": self.bytes,
+            }
+
+
+class BulkHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+
+    def log_message(self, format, *args):
+        pass
+
+    def _reply(self, status: int, body: dict):
+        data = orjson.dumps(body)
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def _read_body(self) -> bytes:
+        body = self.rfile.read(int(self.headers.get("Content-Length", 0)))
+        if self.headers.get("Content-Encoding") == "gzip":
+            body = gzip.decompress(body)
+        return body
+
+    def do_POST(self):
+        body = self._read_body()
+        if not self.path.split("?")[0].rstrip("/").endswith("_bulk"):
+            self._reply(200, {"acknowledged": True})
+            return
+
+        server = self.server
+        time.sleep(server.latency)
+
+        items = []
+        lines = body.splitlines()
+        # Строки идут парами: действие и документ
+        for action in lines[::2]:
+            meta = orjson.loads(action)["index"]
+            status = 429 if server.rnd.random() < server.reject else 201
+            items.append({"index": {"_id": meta.get("_id"), "status": status}})
+
+        rejected = sum(item["index"]["status"] == 429 for item in items)
+        with server.stats.lock:
+            server.stats.requests += 1
+            server.stats.docs += len(items) - rejected
+            server.stats.rejected += rejected
+            server.stats.bytes += len(body)
+
+        self._reply(200, {"took": 1, "errors": bool(rejected), "items": items})
+
+    def do_PUT(self):
+        self._read_body()
+        self._reply(200, {"acknowledged": True})
+
+    def do_GET(self):
+        self._reply(200, {})
+
+    def do_HEAD(self):
+        self.send_response(200)
+        self.send_header("Content-Length", "0")
+        self.end_headers()
+
+
+class BulkServer(ThreadingHTTPServer):
+    """
+    Сервер _bulk: latency — задержка каждого запроса в секундах,
+    reject — доля документов, на которые отвечаем 429
+    """
+
+    daemon_threads = True
+
+    def __init__(self, port: int = 0, latency: float = 0.0, reject: float = 0.0):
+        super().__init__(("127.0.0.1", port), BulkHandler)
+        self.latency = latency
+        self.reject = reject
+        self.rnd = random.Random(42)
+        self.stats = BulkStats()
+
+    @property
+    def url(self) -> str:
+        return f"http://127.0.0.1:{self.server_address[1]}/"
+
+    def start(self) -> "BulkServer":
+        threading.Thread(target=self.serve_forever, daemon=True).start()
+        return self
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Заглушка _bulk для замеров ETL")
+    parser.add_argument("--port", type=int, default=9201)
+    parser.add_argument("--latency", type=float, default=0.0)
+    parser.add_argument("--reject", type=float, default=0.0)
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO)
+    server = BulkServer(args.port, args.latency, args.reject)
+    logging.info(f"Bulk stub listening on {server.url}")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        logging.info(f"Bulk stub stats: {server.stats.as_dict()}")
+
+
+if __name__ == "__main__":
+    main()
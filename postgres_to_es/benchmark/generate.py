@@ -0,0 +1,212 @@
+"""
+Генератор синтетических данных в схеме content.
+
+Популярность персон и жанров неравномерная (как в реальном каталоге):
+у части персон сотни фильмов, у большинства — единицы.
+
+Запуск из каталога postgres_to_es:
+    python -m benchmark.generate --films 100000 --persons 50000 --genres 30 --truncate
+"""
+
+import argparse
+import itertools
+import logging
+import random
+import uuid
+from datetime import datetime, timedelta, timezone
+
+import psycopg2
+from psycopg2.extras import execute_values
+
+from configuration import Config
+
+# Доли ролей в связях персона-фильм
+ROLE_WEIGHTS = {"actor": 0.75, "writer": 0.15, "director": 0.10}
+
+# Сколько строк отправляется в PG одним INSERT
+INSERT_PAGE_SIZE = 5000
+
+TABLES = (
+    "content.person_film_work",
+    "content.genre_film_work",
+    "content.film_work",
+    "content.person",
+    "content.genre",
+)
+
+
+def pages(rows, size: int):
+    rows = iter(rows)
+    while page := list(itertools.islice(rows, size)):
+        yield page
+
+
+def popularity(count: int, skew: float) -> list[float]:
+    # Накопленные веса закона Ципфа для random.choices
+    return list(itertools.accumulate(1 / (rank + 1) ** skew for rank in range(count)))
+
+
+class Generator:
+    """
+    Класс для наполнения content.* случайными фильмами, персонами и жанрами
+    """
+
+    def __init__(self, conn, seed: int):
+        self.conn = conn
+        self.rnd = random.Random(seed)
+        self.now = datetime.now(timezone.utc)
+
+    def _id(self) -> str:
+        return str(uuid.UUID(int=self.rnd.getrandbits(128), version=4))
+
+    def _timestamp(self) -> datetime:
+        return self.now - timedelta(seconds=self.rnd.randint(0, 365 * 24 * 3600))
+
+    def _insert(self, table: str, columns: str, rows):
+        with self.conn.cursor() as cursor:
+            for page in pages(rows, INSERT_PAGE_SIZE):
+                execute_values(
+                    cursor, f"INSERT INTO {table} ({columns}) VALUES %s", page
+                )
+
+    def truncate(self):
+        with self.conn.cursor() as cursor:
+            cursor.execute(f"TRUNCATE {', '.join(TABLES)}")
+
+    def generate(
+        self,
+        films: int,
+        persons: int,
+        genres: int,
+        persons_per_film: int,
+        genres_per_film: int,
+        skew: float,
+    ):
+        genre_ids = [self._id() for _ in range(genres)]
+        self._insert(
+            "content.genre",
+            "id, name, description, created_at, updated_at",
+            (
+                (genre_id, f"Genre {n}", f"Description {n}", ts, ts)
+                for n, genre_id in enumerate(genre_ids)
+                for ts in (self._timestamp(),)
+            ),
+        )
+
+        person_ids = [self._id() for _ in range(persons)]
+        self._insert(
+            "content.person",
+            "id, full_name, created_at, updated_at",
+            (
+                (person_id, f"Person {n}", ts, ts)
+                for n, person_id in enumerate(person_ids)
+                for ts in (self._timestamp(),)
+            ),
+        )
+
+        film_ids = [self._id() for _ in range(films)]
+        self._insert(
+            "content.film_work",
+            "id, title, description, rating, type, created_at, updated_at",
+            (
+                (
+                    film_id,
+                    f"Film {n}",
+                    self.rnd.choice([None, f"Description of film {n} " * 10]),
+                    self.rnd.choice([None, round(self.rnd.uniform(1, 10), 1)]),
+                    self.rnd.choice(["movie", "tv_show"]),
+                    ts,
+                    ts,
+                )
+                for n, film_id in enumerate(film_ids)
+                for ts in (self._timestamp(),)
+            ),
+        )
+
+        person_weights = popularity(persons, skew)
+        genre_weights = popularity(genres, skew)
+
+        self._insert(
+            "content.person_film_work",
+            "id, film_work_id, person_id, role, created_at",
+            (
+                (self._id(), film_id, person_id, role, self.now)
+                for film_id in film_ids
+                for person_id, role in self._film_persons(
+                    person_ids, person_weights, persons_per_film
+                )
+            ),
+        )
+
+        self._insert(
+            "content.genre_film_work",
+            "id, film_work_id, genre_id, created_at",
+            (
+                (self._id(), film_id, genre_id, self.now)
+                for film_id in film_ids
+                for genre_id in self._sample(genre_ids, genre_weights, genres_per_film)
+            ),
+        )
+
+    def _sample(self, ids: list[str], weights: list[float], mean: int) -> list[str]:
+        # Без повторов, в среднем около mean записей
+        k = self.rnd.randint(1, 2 * mean - 1)
+        return list(dict.fromkeys(self.rnd.choices(ids, cum_weights=weights, k=k)))
+
+    def _film_persons(self, ids: list[str], weights: list[float], mean: int):
+        roles, role_weights = zip(*ROLE_WEIGHTS.items())
+        for person_id in self._sample(ids, weights, mean):
+            yield person_id, self.rnd.choices(roles, role_weights)[0]
+
+    def touch(self, share: float) -> dict[str, int]:
+        """
+        Отмечаем изменённой долю записей каждой таблицы для инкрементальной загрузки
+        """
+
+        touched = {}
+        with self.conn.cursor() as cursor:
+            for table in ("film_work", "person", "genre"):
+                cursor.execute(
+                    f"UPDATE content.{table} SET updated_at = NOW() "
+                    "WHERE random() < %(share)s",
+                    {"share": share},
+                )
+                touched[table] = cursor.rowcount
+        return touched
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Синтетические данные для ETL")
+    parser.add_argument("--films", type=int, default=10000)
+    parser.add_argument("--persons", type=int, default=5000)
+    parser.add_argument("--genres", type=int, default=30)
+    parser.add_argument("--persons-per-film", type=int, default=10)
+    parser.add_argument("--genres-per-film", type=int, default=2)
+    parser.add_argument("--skew", type=float, default=0.8)
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--truncate", action="store_true")
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO)
+
+    with psycopg2.connect(dsn=Config().pg_dsn) as conn:
+        generator = Generator(conn, args.seed)
+        if args.truncate:
+            generator.truncate()
+        generator.generate(
+            args.films,
+            args.persons,
+            args.genres,
+            args.persons_per_film,
+            args.genres_per_film,
+            args.skew,
+        )
+    conn.close()
+
+    logging.info(
+        f"Generated {args.films} films, {args.persons} persons, {args.genres} genres"
+    )
+
+
+if __name__ == "__main__":
+    main()
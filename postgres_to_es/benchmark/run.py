@@ -0,0 +1,219 @@
+"""
+Замер полной и инкрементальной загрузки ETL.
+
+Данные берутся из PG (см. benchmark.generate), документы по умолчанию
+отправляются в локальную заглушку _bulk (benchmark.es_stub), запущенную
+в этом же процессе. Результат — json, который удобно сравнивать между запусками.
+
+Запуск из каталога postgres_to_es:
+    python -m benchmark.run --pack-size 500 --es-writers 8 --output result.json
+"""
+
+import argparse
+import contextlib
+import logging
+import os
+import resource
+import subprocess
+import tempfile
+import time
+from datetime import datetime, timezone
+
+import orjson
+import psycopg2
+
+import pipeline
+from benchmark.es_stub import BulkServer
+from benchmark.generate import Generator
+from configuration import Config
+from content_hash import DbmHashStore, SkipUnchanged
+from main import ENTITY, load_entity, load_movies, make_upload, prepare_pg
+from pg_loader import PgLoader
+from state import JsonFileStorage, State
+
+
+class CountingLoader(PgLoader):
+    """
+    PgLoader, который считает строки, прочитанные из PG
+    """
+
+    rows = 0
+
+    def fetch(self, sql_query: str, params) -> list[tuple]:
+        rows = super().fetch(sql_query, params)
+        self.rows += len(rows)
+        return rows
+
+    def read_rows(self, *args, **kwargs):
+        for batch, watermark in super().read_rows(*args, **kwargs):
+            self.rows += len(batch.rows)
+            yield batch, watermark
+
+    def read_by_ids(self, *args, **kwargs):
+        for batch, watermark in super().read_by_ids(*args, **kwargs):
+            self.rows += len(batch.rows)
+            yield batch, watermark
+
+
+def reset_peak_rss() -> bool:
+    """
+    Сбрасываем пик памяти процесса (VmHWM), чтобы у каждого прохода был свой.
+    Если ядро этого не умеет, пик будет общим для процесса
+    """
+
+    try:
+        with open("/proc/self/clear_refs", "w") as f:
+            f.write("5")
+        return True
+    except OSError:
+        return False
+
+
+def peak_rss_mb() -> float:
+    with contextlib.suppress(OSError):
+        with open("/proc/self/status") as f:
+            for line in f:
+                if line.startswith("VmHWM:"):
+                    return int(line.split()[1]) / 1024
+    # ru_maxrss в Linux — килобайты, и он не сбрасывается
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+
+
+def git_revision() -> str | None:
+    with contextlib.suppress(Exception):
+        return subprocess.check_output(
+            ["git", "rev-parse", "--short", "HEAD"], text=True
+        ).strip()
+    return None
+
+
+def load(
+    conf: Config, state: State, modified: str, skipper: SkipUnchanged | None
+) -> dict:
+    """
+    Один проход ETL, как в main.run, но с замером каждой стадии
+    """
+
+    pipeline.stats.reset()
+    per_phase = reset_peak_rss()
+    started = time.perf_counter()
+
+    with psycopg2.connect(dsn=conf.pg_dsn) as conn:
+        loader = CountingLoader(conn, conf.pack_size, conf.pg_itersize)
+        load_movies(
+            conf, loader, state, modified, make_upload(conf, None, "movies", skipper)
+        )
+        for entity in ENTITY:
+            upload = make_upload(conf, None, ENTITY[entity]["index"], skipper)
+            load_entity(conf, loader, state, modified, entity, upload)
+    conn.close()
+
+    elapsed = time.perf_counter() - started
+    stages = pipeline.stats.snapshot()
+    docs = stages.get("upload", {}).get("items", 0)
+    skip_ratio = skipper.skip_ratio if skipper else None
+    if skipper:
+        skipper.checked = skipper.skipped = 0
+
+    return {
+        "seconds": elapsed,
+        "rows": loader.rows,
+        "docs": docs,
+        "rows_per_sec": loader.rows / elapsed if elapsed else 0,
+        "docs_per_sec": docs / elapsed if elapsed else 0,
+        "peak_rss_mb": peak_rss_mb(),
+        # phase — пик этого прохода, process — пик процесса с момента запуска
+        "peak_rss_scope": "phase" if per_phase else "process",
+        "skip_ratio": skip_ratio,
+        "stages": stages,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Замер скорости ETL")
+    parser.add_argument("--es-url", help="настоящий ELK вместо заглушки")
+    parser.add_argument("--latency", type=float, default=0.0)
+    parser.add_argument("--reject", type=float, default=0.0)
+    parser.add_argument("--touch", type=float, default=0.05)
+    parser.add_argument("--pack-size", type=int)
+    parser.add_argument("--pg-itersize", type=int)
+    parser.add_argument("--transform-workers", type=int)
+    parser.add_argument("--es-writers", type=int)
+    parser.add_argument("--es-bulk-max-docs", type=int)
+    parser.add_argument(
+        "--skip-unchanged",
+        action="store_true",
+        help="отсеивать неизменившиеся документы по хешам (dbm во временном каталоге)",
+    )
+    parser.add_argument("--output")
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.WARNING)
+
+    server = None
+    if not args.es_url:
+        server = BulkServer(latency=args.latency, reject=args.reject).start()
+
+    overrides = {
+        name: value
+        for name in (
+            "pack_size",
+            "pg_itersize",
+            "transform_workers",
+            "es_writers",
+            "es_bulk_max_docs",
+        )
+        if (value := getattr(args, name)) is not None
+    }
+    conf = Config().model_copy(
+        update=overrides | {"es_url": args.es_url or server.url}
+    )
+
+    prepare_pg(conf)
+
+    with tempfile.TemporaryDirectory() as directory:
+        state = State(JsonFileStorage(os.path.join(directory, "state.json")))
+        skipper = None
+        if args.skip_unchanged:
+            skipper = SkipUnchanged(DbmHashStore(os.path.join(directory, "hashes")))
+
+        full = load(conf, state, conf.start_date, skipper)
+
+        with psycopg2.connect(dsn=conf.pg_dsn) as conn:
+            touched = Generator(conn, seed=0).touch(args.touch)
+        conn.close()
+
+        incremental = load(conf, state, conf.start_date, skipper)
+
+    result = {
+        "timestamp": datetime.now(timezone.utc).isoformat(),
+        "revision": git_revision(),
+        "config": {
+            "pack_size": conf.pack_size,
+            "pg_itersize": conf.pg_itersize,
+            "transform_workers": conf.transform_workers,
+            "es_writers": conf.es_writers,
+            "queue_size": conf.queue_size,
+            "es_bulk_max_docs": conf.es_bulk_max_docs,
+            "es_bulk_max_bytes": conf.es_bulk_max_bytes,
+            "es_bulk_compress": conf.es_bulk_compress,
+            "es_stub": server
+            and {"latency": server.latency, "reject": server.reject},
+        },
+        "full": full,
+        "incremental": incremental | {"touched": touched},
+        "es": server and server.stats.as_dict(),
+    }
+
+    output = orjson.dumps(result, option=orjson.OPT_INDENT_2)
+    if args.output:
+        with open(args.output, "wb") as f:
+            f.write(output)
+    print(output.decode())
+
+    if server:
+        server.shutdown()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,198 @@
+"""
+Проверка совпадения и замер скорости преобразования строк PG в документы ELK.
+
+Запуск из каталога postgres_to_es:
+    python -m benchmark.transform --docs 20000
+"""
+
+import argparse
+import random
+import time
+import uuid
+
+import orjson
+
+from models import Genre, Movie, Person, PersonShort
+from pg_loader import MOVIE_COLUMNS, Batch, transform
+
+ROLES = ("actor", "writer", "director")
+
+PERSON_COLUMNS = {"id": 0, "full_name": 1, "updated_at": 2, "films": 3}
+GENRE_COLUMNS = {"id": 0, "name": 1, "description": 2, "created_at": 3, "updated_at": 4}
+
+
+def reference_movie(row, columns) -> Movie:
+    """
+    Прежнее преобразование фильма через модели pydantic
+    """
+
+    persons = row[columns["persons"]]
+
+    actors = [
+        PersonShort(person_id=x["person_id"], person_name=x["person_name"])
+        for x in persons
+        if x.get("person_role") == "actor"
+    ]
+    writers = [
+        PersonShort(person_id=x["person_id"], person_name=x["person_name"])
+        for x in persons
+        if x.get("person_role") == "writer"
+    ]
+
+    return Movie(
+        id=row[columns["id"]],
+        rating=row[columns["rating"]],
+        genres=row[columns["genres"]],
+        title=row[columns["title"]],
+        description=row[columns["description"]],
+        director=" ".join(
+            [
+                x.get("person_name")
+                for x in persons
+                if x.get("person_role") == "director"
+            ]
+        ).strip(),
+        actors_names=" ".join([person.name for person in actors]),
+        writers_names=[person.name for person in writers],
+        actors=actors,
+        writers=writers,
+    )
+
+
+def reference_person(row, columns) -> Person:
+    """
+    Прежнее преобразование персоны. Оно повторяло фильм для каждой роли в нём
+    (сравнение `i not in films` никогда не срабатывало), поэтому при сравнении
+    такие повторы схлопываются
+    """
+
+    films = []
+    person_films = row[columns["films"]] or []
+
+    for i in person_films:
+        films.append(
+            {
+                "id": i["id"],
+                "roles": [x["role"] for x in person_films if x["id"] == i["id"]],
+            }
+        )
+
+    unique = list({film["id"]: film for film in films}.values())
+    return Person(id=row[columns["id"]], full_name=row[columns["full_name"]], films=unique)
+
+
+def reference_genre(row, columns) -> Genre:
+    return Genre(
+        id=row[columns["id"]], name=row[columns["name"]], description=row[columns["description"]]
+    )
+
+
+REFERENCE = {
+    "movies": reference_movie,
+    "persons": reference_person,
+    "genres": reference_genre,
+}
+
+
+def reference_transform(index: str, batch: Batch) -> list[bytes]:
+    return [
+        REFERENCE[index](row, batch.columns).model_dump_json().encode()
+        for row in batch.rows
+    ]
+
+
+def make_batches(docs: int, pack_size: int, seed: int) -> dict[str, list[Batch]]:
+    """
+    Синтетические строки в том виде, в котором их отдаёт PgLoader.enrich
+    """
+
+    rnd = random.Random(seed)
+    ids = lambda n: [str(uuid.UUID(int=rnd.getrandbits(128))) for _ in range(n)]
+    names = ["Имя Фамилия", "John Smith", "Anna O'Neil", 'Quote "Q" Name', "Zoë Ñ"]
+    film_ids, person_ids = ids(docs), ids(docs)
+
+    movies = [
+        (
+            film_id,
+            f"Фильм {n}",
+            rnd.choice([None, "Описание с юникодом — «кавычки»"]),
+            rnd.choice([None, round(rnd.uniform(0, 10), 1)]),
+            "movie",
+            "2021-06-16 20:14:09.222989+00",
+            [
+                {
+                    "person_role": rnd.choice(ROLES),
+                    "person_id": rnd.choice(person_ids),
+                    "person_name": rnd.choice(names),
+                }
+                for _ in range(rnd.randint(0, 20))
+            ],
+            sorted(rnd.sample(["Action", "Drama", "Comedy", "Sci-Fi"], rnd.randint(0, 3))),
+        )
+        for n, film_id in enumerate(film_ids)
+    ]
+
+    persons = []
+    for person_id in person_ids:
+        films = []
+        for film_id in rnd.sample(film_ids, rnd.randint(0, 5)):
+            films += [{"id": film_id, "role": r} for r in rnd.sample(ROLES, rnd.randint(1, 3))]
+        persons.append((person_id, rnd.choice(names), "2021-06-16", films or None))
+
+    genres = [
+        (genre_id, f"Жанр {n}", rnd.choice([None, "Описание"]), "2021-06-16", "2021-06-16")
+        for n, genre_id in enumerate(ids(docs))
+    ]
+
+    chunk = lambda rows, columns: [
+        Batch(columns, rows[i : i + pack_size]) for i in range(0, len(rows), pack_size)
+    ]
+    return {
+        "movies": chunk(movies, MOVIE_COLUMNS),
+        "persons": chunk(persons, PERSON_COLUMNS),
+        "genres": chunk(genres, GENRE_COLUMNS),
+    }
+
+
+def check_parity(batches: dict[str, list[Batch]]):
+    """
+    Документы нового пути должны совпадать с прежними по содержимому
+    """
+
+    for index, index_batches in batches.items():
+        for batch in index_batches:
+            fast = [doc.source for doc in transform(index, batch)]
+            reference = reference_transform(index, batch)
+            for new, old in zip(fast, reference, strict=True):
+                if orjson.loads(new) != orjson.loads(old):
+                    raise AssertionError(f"{index}: {new!r} != {old!r}")
+        print(f"{index}: parity ok")
+
+
+def measure(name: str, func, index: str, index_batches: list[Batch]) -> float:
+    started = time.perf_counter()
+    docs = sum(len(func(index, batch)) for batch in index_batches)
+    elapsed = time.perf_counter() - started
+    rate = docs / elapsed
+    print(f"{index:8} {name:10} {docs} docs in {elapsed:.3f} sec ({rate:.0f} docs/sec)")
+    return rate
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Скорость преобразования документов")
+    parser.add_argument("--docs", type=int, default=20000)
+    parser.add_argument("--pack-size", type=int, default=100)
+    parser.add_argument("--seed", type=int, default=42)
+    args = parser.parse_args()
+
+    batches = make_batches(args.docs, args.pack_size, args.seed)
+    check_parity(batches)
+
+    for index, index_batches in batches.items():
+        old = measure("reference", reference_transform, index, index_batches)
+        new = measure("fast", transform, index, index_batches)
+        print(f"{index:8} speedup x{new / old:.1f}")
+
+
+if __name__ == "__main__":
+    main()
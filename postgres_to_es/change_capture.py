@@ -0,0 +1,79 @@
+import contextlib
+import json
+import logging
+import select
+import time
+from collections import defaultdict
+
+import psycopg2
+
+from backoff import backoff
+from queries import CHANGE_CAPTURE_TRIGGERS
+
+
+class ChangeListener:
+    """
+    Класс для получения изменений из PG через LISTEN/NOTIFY.
+
+    При создании ставит триггеры на таблицы content.* и подписывается на канал.
+    wait ждёт первое уведомление, затем ещё window секунд собирает пачку,
+    чтобы всплеск изменений обработать за один проход.
+    """
+
+    def __init__(self, dsn: str, channel: str, window: float):
+        self.dsn = dsn
+        self.channel = channel
+        self.window = window
+        self._connect()
+
+    @backoff(start_sleep_time=0.1, factor=2, border_sleep_time=10)
+    def _connect(self):
+        # Пока PG недоступен, ждём с нарастающей паузой: и при старте,
+        # и после обрыва, вместо мгновенных повторов в цикле listen
+        conn = psycopg2.connect(dsn=self.dsn)
+        try:
+            conn.autocommit = True
+            with conn.cursor() as cur:
+                cur.execute(CHANGE_CAPTURE_TRIGGERS.format(channel=self.channel))
+                cur.execute(f"LISTEN {self.channel}")
+        except BaseException:
+            conn.close()
+            raise
+        self.conn = conn
+
+    def wait(self, timeout: float) -> dict[str, set[str]] | None:
+        """
+        Возвращает id изменённых записей по таблицам или None, если за timeout
+        изменений не было (или соединение пришлось восстановить)
+        """
+
+        try:
+            if not self._poll(timeout):
+                return None
+
+            deadline = time.monotonic() + self.window
+            while (left := deadline - time.monotonic()) > 0:
+                self._poll(left)
+        except psycopg2.Error as ex:
+            # Уведомления могли потеряться: пусть отработает обычный проход по отметкам
+            logging.error(f"Change listener connection lost: {ex}")
+            self._reconnect()
+            return None
+
+        changes = defaultdict(set)
+        for notify in self.conn.notifies:
+            payload = json.loads(notify.payload)
+            changes[payload["table"]].add(payload["id"])
+        self.conn.notifies.clear()
+
+        return changes
+
+    def _poll(self, timeout: float) -> bool:
+        if select.select([self.conn], [], [], timeout) != ([], [], []):
+            self.conn.poll()
+        return bool(self.conn.notifies)
+
+    def _reconnect(self):
+        with contextlib.suppress(psycopg2.Error):
+            self.conn.close()
+        self._connect()
@@ -6,10 +6,62 @@ class Config(BaseSettings):
 
     pg_dsn: str
     pack_size: int = 100
+    # Сколько изменённых записей каждого источника собирается за один цикл
+    collect_limit: int = 10000
+    # Сколько строк серверный курсор PG отдаёт за один сетевой запрос
+    pg_itersize: int = 2000
+
+    # Конвейер загрузки: потоки преобразования, потоки записи в ELK
+    # и размер очередей между стадиями
+    transform_workers: int = 2
+    es_writers: int = 4
+    queue_size: int = 8
+
+    # Запросы _bulk: лимиты по числу документов и размеру тела,
+    # сжатие тела gzip и число повторов отклонённых документов
+    es_bulk_max_docs: int = 500
+    es_bulk_max_bytes: int = 5 * 1024 * 1024
+    es_bulk_compress: bool = False
+    es_bulk_retries: int = 5
+    # Таймауты HTTP-запросов к ELK, секунд: установка соединения и ожидание
+    # ответа. Без них запрос в полуоткрытое соединение висит вечно и повторы
+    # не срабатывают. Слияние сегментов после полной загрузки идёт дольше
+    es_connect_timeout: float = 5
+    es_read_timeout: float = 60
+    es_forcemerge_timeout: float = 3600
+    # Число реплик индексов после загрузки (на время полной загрузки реплик нет)
+    es_replicas: int = 1
 
     start_date: str = "1970-01-01 00:00:00"
     file_storage: str = "state.json"
+    # Где хранить отметки загрузки: file, redis или postgres
+    state_storage: str = "file"
+    state_key: str = "postgres_to_es"
+    # Как часто сохранять отметки во время загрузки, секунд
+    state_commit_interval: float = 5
     sleep_time: int = 10
+    # Порт, на котором отдаются метрики Prometheus (/metrics); 0 — не отдавать
+    metrics_port: int = 9108
+
+    # Хеши записанных документов, чтобы не перезаписывать неизменившиеся:
+    # none, redis или dbm (локальный файл content_hash_file).
+    # force_full_refresh отправляет в ELK все документы, не глядя на хеши
+    content_hash_store: str = "none"
+    content_hash_file: str = "content_hashes.db"
+    force_full_refresh: bool = False
+
+    # Захват изменений через триггеры и LISTEN/NOTIFY: пачка уведомлений
+    # собирается change_window секунд, полный проход по отметкам остаётся
+    # запасным и выполняется раз в poll_interval секунд
+    change_capture: bool = False
+    change_channel: str = "content_changes"
+    change_window: float = 0.5
+    poll_interval: int = 300
+
+    # Redis для оповещения API об изменениях; если не задан, оповещения выключены
+    redis_host: str | None = None
+    redis_port: int = 6379
+    cache_invalidation_channel: str = "etl-updates"
 
     model_config = SettingsConfigDict(
         env_file_encoding="utf-8",
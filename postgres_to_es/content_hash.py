@@ -0,0 +1,115 @@
+import abc
+import dbm
+import hashlib
+import logging
+import threading
+
+from redis import Redis
+
+from metrics import DOCS_SKIPPED
+from pg_loader import Document
+
+# Размер хеша документа в байтах: коллизия на миллионах документов маловероятна
+DIGEST_SIZE = 8
+
+
+def content_hash(source: bytes) -> bytes:
+    return hashlib.blake2b(source, digest_size=DIGEST_SIZE).digest()
+
+
+class BaseHashStore(abc.ABC):
+    """Абстрактное хранилище хешей документов, уже записанных в ELK."""
+
+    @abc.abstractmethod
+    def get_many(self, index: str, ids: list[str]) -> list[bytes | None]:
+        """Получить хеши документов по id, None — документ ещё не записывался."""
+
+    @abc.abstractmethod
+    def set_many(self, index: str, hashes: dict[str, bytes]) -> None:
+        """Запомнить хеши записанных документов."""
+
+
+class RedisHashStore(BaseHashStore):
+    """Реализация хранилища, использующего hash в Redis: один ключ на индекс."""
+
+    def __init__(self, redis: Redis, key: str) -> None:
+        self.redis = redis
+        self.key = key
+
+    def get_many(self, index: str, ids: list[str]) -> list[bytes | None]:
+        return self.redis.hmget(f"{self.key}-hashes-{index}", ids)
+
+    def set_many(self, index: str, hashes: dict[str, bytes]) -> None:
+        self.redis.hset(f"{self.key}-hashes-{index}", mapping=hashes)
+
+
+class DbmHashStore(BaseHashStore):
+    """Реализация хранилища, использующего локальный файл dbm.
+
+    Файл не потокобезопасен, поэтому обращения идут под блокировкой.
+    """
+
+    def __init__(self, file_path: str) -> None:
+        self.db = dbm.open(file_path, "c")
+        self._lock = threading.Lock()
+
+    def get_many(self, index: str, ids: list[str]) -> list[bytes | None]:
+        with self._lock:
+            return [self.db.get(f"{index}:{i}") for i in ids]
+
+    def set_many(self, index: str, hashes: dict[str, bytes]) -> None:
+        with self._lock:
+            for i, value in hashes.items():
+                self.db[f"{index}:{i}"] = value
+
+
+class SkipUnchanged:
+    """
+    Отсеивает документы, которые не изменились с последней записи в ELK.
+
+    Хеши запоминаются только после успешной записи и только для принятых
+    ELK документов, поэтому упавшая пачка при повторе уйдёт в ELK целиком,
+    а отвергнутый документ — при следующем проходе. force — полная перезаливка: документы
+    не отсеиваются, но хеши обновляются.
+    """
+
+    def __init__(self, store: BaseHashStore, force: bool = False):
+        self.store = store
+        self.force = force
+        self._lock = threading.Lock()
+        self.checked = 0
+        self.skipped = 0
+
+    @property
+    def skip_ratio(self) -> float:
+        return self.skipped / self.checked if self.checked else 0.0
+
+    def filter(
+        self, index: str, docs: list[Document]
+    ) -> tuple[list[Document], dict[str, bytes]]:
+        """
+        Возвращает изменённые документы и их хеши для remember
+        """
+
+        hashes = {doc.id: content_hash(doc.source) for doc in docs}
+        if self.force or not docs:
+            return docs, hashes
+
+        known = self.store.get_many(index, [doc.id for doc in docs])
+        changed = [doc for doc, old in zip(docs, known) if old != hashes[doc.id]]
+
+        with self._lock:
+            self.checked += len(docs)
+            self.skipped += len(docs) - len(changed)
+            ratio = self.skip_ratio
+        DOCS_SKIPPED.labels(index).inc(len(docs) - len(changed))
+
+        logging.info(
+            f"{index}: {len(docs) - len(changed)} of {len(docs)} docs unchanged, "
+            f"skip ratio {ratio:.1%}"
+        )
+        return changed, {doc.id: hashes[doc.id] for doc in changed}
+
+    def remember(self, index: str, hashes: dict[str, bytes]):
+        if hashes:
+            self.store.set_many(index, hashes)
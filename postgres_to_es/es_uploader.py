@@ -1,8 +1,21 @@
-import json
+import gzip
+import logging
+import time
 
+import orjson
 import requests
+from requests.adapters import HTTPAdapter
 
 from backoff import backoff
+from metrics import BULK_SECONDS, DOCS_FAILED, DOCS_INDEXED, DOCS_RETRIED
+from pg_loader import Document
+
+# Статусы отдельных документов в ответе _bulk, которые имеет смысл повторить
+RETRY_STATUSES = {429, 502, 503, 504}
+
+
+class BulkError(Exception):
+    """Часть документов так и не удалось записать"""
 
 
 class EsUploader:
@@ -10,23 +23,147 @@ class EsUploader:
     Класс для работы с ELK
     """
 
-    def __init__(self, url, index):
+    def __init__(
+        self,
+        url,
+        index,
+        max_docs: int = 500,
+        max_bytes: int = 5 * 1024 * 1024,
+        compress: bool = False,
+        retries: int = 5,
+        pool_size: int = 4,
+        timeout: tuple[float, float] = (5, 60),
+        refresh: bool = False,
+    ):
         self.url = url
         self.index = index
+        self.max_docs = max_docs
+        self.max_bytes = max_bytes
+        self.compress = compress
+        self.retries = retries
+        # (соединение, ответ) для каждого запроса: у requests таймаута по умолчанию нет
+        self.timeout = timeout
+        # refresh=wait_for: _bulk отвечает, когда документы уже видны поиску.
+        # Нужно, если после записи API оповещается об изменениях, иначе первый
+        # запрос после оповещения закеширует старый результат под новым поколением
+        self.params = {"refresh": "wait_for"} if refresh else {}
+
+        # Постоянные соединения: одна сессия на загрузчик, пул по числу потоков записи
+        self.session = requests.Session()
+        self.session.mount(self.url, HTTPAdapter(pool_maxsize=pool_size))
+        self.session.headers["Content-Type"] = "application/json; charset=utf-8"
+        if compress:
+            self.session.headers["Content-Encoding"] = "gzip"
+
+    def close(self):
+        self.session.close()
 
     @backoff(start_sleep_time=0.1, factor=2, border_sleep_time=10)
-    def upload(self, data: list):
-        data_list = list()
+    def upload(self, data: list[Document]) -> set[str]:
+        """
+        Пачка разбивается на запросы _bulk по количеству документов и по размеру тела.
+        Возвращает id документов, которые ELK отверг без права на повтор
+        """
+
+        batch, size, failed = [], 0, set()
 
         for i in data:
-            data_list.append(json.dumps({"index": {"_index": self.index, "_id": i.id}}))
-            data_list.append(i.json())
+            item = b"".join(
+                (
+                    orjson.dumps({"index": {"_index": self.index, "_id": i.id}}),
+                    b"\n",
+                    i.source,
+                    b"\n",
+                )
+            )
+
+            if batch and (
+                len(batch) >= self.max_docs or size + len(item) > self.max_bytes
+            ):
+                failed |= self._send(batch)
+                batch, size = [], 0
+
+            batch.append(item)
+            size += len(item)
+
+        if batch:
+            failed |= self._send(batch)
+
+        return failed
+
+    def _send(self, items: list[bytes]) -> set[str]:
+        """
+        Отправляем _bulk и повторяем только отклонённые документы
+        """
 
-        data = "\n".join(data_list)
-        data += "\n"
+        started = time.monotonic()
+        sent = len(items)
+        delay = 0.1
+        failed = set()
 
-        requests.post(
-            self.url + "_bulk",
-            headers={"Content-Type": "application/json; charset=utf-8"},
-            data=data.encode("utf-8"),
+        for attempt in range(self.retries + 1):
+            if attempt:
+                time.sleep(delay)
+                delay *= 2
+                DOCS_RETRIED.labels(self.index).inc(len(items))
+
+            body = b"".join(items)
+            if self.compress:
+                body = gzip.compress(body, compresslevel=1)
+
+            with BULK_SECONDS.labels(self.index).time():
+                response = self.session.post(
+                    self.url + "_bulk",
+                    data=body,
+                    params=self.params,
+                    timeout=self.timeout,
+                )
+            response.raise_for_status()
+            result = response.json()
+
+            if not result.get("errors"):
+                DOCS_INDEXED.labels(self.index).inc(len(items))
+                items = []
+                break
+
+            items = self._rejected(items, result["items"], failed)
+            if not items:
+                break
+
+        if items:
+            DOCS_FAILED.labels(self.index).inc(len(items))
+            raise BulkError(f"{len(items)} documents were rejected by {self.index}")
+
+        elapsed = time.monotonic() - started
+        logging.info(
+            f"{self.index}: {sent} docs in {elapsed:.3f} sec "
+            f"({sent / elapsed if elapsed else sent:.0f} docs/sec)"
         )
+        return failed
+
+    def _rejected(
+        self, items: list[bytes], results: list[dict], failed: set[str]
+    ) -> list[bytes]:
+        """
+        Документы для повтора. id документов с неисправимыми ошибками
+        добавляются в failed
+        """
+
+        rejected = []
+
+        for item, result in zip(items, results):
+            status = result["index"]["status"]
+            if status < 300:
+                DOCS_INDEXED.labels(self.index).inc()
+            elif status in RETRY_STATUSES:
+                rejected.append(item)
+            else:
+                DOCS_FAILED.labels(self.index).inc()
+                failed.add(result["index"]["_id"])
+                # Ошибки маппинга и прочие 4xx повторять бессмысленно
+                logging.error(
+                    f"{self.index}: document {result['index'].get('_id')} "
+                    f"failed: {result['index'].get('error')}"
+                )
+
+        return rejected
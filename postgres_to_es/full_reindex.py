@@ -0,0 +1,203 @@
+import argparse
+import contextlib
+import logging
+import os
+from concurrent.futures import ProcessPoolExecutor
+from functools import partial
+from itertools import product
+
+import psycopg2
+
+from backoff import backoff
+from configuration import Config
+from es_uploader import EsUploader
+from indices import IndexManager, make_manager
+from main import (
+    load_entity,
+    load_movies,
+    make_publisher,
+    make_uploader,
+    prepare_pg,
+)
+from pg_loader import PgLoader, transform
+from pipeline import Pipeline
+from queries import MIN_ID, GENRES_PARTITION, MOVIES_PARTITION, PERSONS_PARTITION
+from state import Checkpoint, JsonFileStorage, State
+
+PARTITION_QUERIES = {
+    "movies": MOVIES_PARTITION,
+    "genres": GENRES_PARTITION,
+    "persons": PERSONS_PARTITION,
+}
+
+
+def checkpoint_path(conf: Config, index: str, part: int | str) -> str:
+    return f"{conf.file_storage}.{index}-{part}"
+
+
+@backoff(start_sleep_time=0.1, factor=2, border_sleep_time=10)
+def reindex_partition(conf: Config, index: str, target: str, part: int, parts: int):
+    """
+    Переиндексация одного раздела в отдельном процессе: своё соединение с PG,
+    свой загрузчик в ELK и своя контрольная точка (последний записанный id).
+    Документы пишутся в новую версию индекса target, а не в псевдоним
+    """
+
+    state = State(JsonFileStorage(file_path=checkpoint_path(conf, index, part)))
+    if state.get_state("done"):
+        return
+
+    after = state.get_state("after") or MIN_ID
+    checkpoint = Checkpoint(state, "after", conf.state_commit_interval)
+    logging.info(f"{index} [{part + 1}/{parts}]: starting after {after}")
+
+    # closing, а не просто with: with соединения psycopg2 завершает только
+    # транзакцию, и каждая упавшая попытка оставляла бы открытое соединение
+    with contextlib.closing(psycopg2.connect(dsn=conf.pg_dsn)) as conn, conn:
+        loader = PgLoader(conn, conf.pack_size, conf.pg_itersize)
+        uploader = EsUploader(
+            conf.es_url,
+            target,
+            max_docs=conf.es_bulk_max_docs,
+            max_bytes=conf.es_bulk_max_bytes,
+            compress=conf.es_bulk_compress,
+            retries=conf.es_bulk_retries,
+            pool_size=conf.es_writers,
+            timeout=(conf.es_connect_timeout, conf.es_read_timeout),
+        )
+        pipeline = Pipeline(
+            transform=partial(transform, index),
+            upload=uploader.upload,
+            commit=lambda watermark: checkpoint.commit(watermark[0]),
+            transform_workers=conf.transform_workers,
+            writers=conf.es_writers,
+            queue_size=conf.queue_size,
+        )
+        try:
+            pipeline.run(
+                loader.enrich(
+                    index,
+                    loader.read_rows(
+                        PARTITION_QUERIES[index],
+                        {"parts": parts, "part": part, "after": after},
+                        watermark=("id",),
+                        entity=index,
+                    ),
+                )
+            )
+        finally:
+            checkpoint.flush()
+            uploader.close()
+
+    state.set_state("done", True)
+    logging.info(f"{index} [{part + 1}/{parts}]: done")
+
+
+@backoff(start_sleep_time=0.1, factor=2, border_sleep_time=10)
+def catch_up(conf: Config, index: str, target: str, since: str):
+    """
+    Догружаем в новую версию изменения, сделанные во время переиндексации:
+    обычный инкрементальный проход от момента начала, но в индекс target
+    """
+
+    state = State(JsonFileStorage(file_path=checkpoint_path(conf, index, "catch-up")))
+
+    with contextlib.closing(psycopg2.connect(dsn=conf.pg_dsn)) as conn, conn:
+        loader = PgLoader(conn, conf.pack_size, conf.pg_itersize)
+        with contextlib.closing(make_uploader(conf, target)) as uploader:
+            if index == "movies":
+                load_movies(conf, loader, state, since, uploader.upload)
+            else:
+                load_entity(conf, loader, state, since, index, uploader.upload)
+
+
+def start_targets(conf: Config, manager: IndexManager, indices: list[str]) -> State:
+    """
+    Новые версии индексов и момент начала переиндексации запоминаются,
+    чтобы после перезапуска продолжить загрузку в те же индексы
+    """
+
+    state = State(JsonFileStorage(file_path=f"{conf.file_storage}.reindex"))
+
+    with contextlib.closing(psycopg2.connect(dsn=conf.pg_dsn)) as conn, conn:
+        loader = PgLoader(conn, conf.pack_size, conf.pg_itersize)
+        (started,), = loader.fetch("SELECT NOW()", {})
+
+    for index in indices:
+        if not state.get_state(index):
+            target = manager.create(index, bulk=True)
+            state.set_state(index, {"target": target, "started": str(started)})
+
+    return state
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Полная переиндексация в несколько процессов"
+    )
+    parser.add_argument(
+        "--index", nargs="+", choices=PARTITION_QUERIES, default=list(PARTITION_QUERIES)
+    )
+    parser.add_argument("--parts", type=int, default=os.cpu_count())
+    parser.add_argument("--workers", type=int, default=os.cpu_count())
+    parser.add_argument(
+        "--keep-old",
+        action="store_true",
+        help="не удалять прежние версии индексов после переключения псевдонима",
+    )
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO)
+    conf = Config()
+    manager = make_manager(conf)
+    prepare_pg(conf)
+    publisher = make_publisher(conf)
+    state = start_targets(conf, manager, args.index)
+    targets = {index: state.get_state(index) for index in args.index}
+    tasks = list(product(args.index, range(args.parts)))
+
+    with ProcessPoolExecutor(max_workers=args.workers) as executor:
+        futures = [
+            executor.submit(
+                reindex_partition,
+                conf,
+                index,
+                targets[index]["target"],
+                part,
+                args.parts,
+            )
+            for index, part in tasks
+        ]
+        for future in futures:
+            future.result()
+
+    for index, target in targets.items():
+        catch_up(conf, index, target["target"], target["started"])
+        manager.finalize(index, target["target"])
+        # Слияние сегментов может идти минутами, а инкрементальный ETL всё это
+        # время пишет в прежнюю версию. Второй проход продолжает с отметки
+        # первого и догружает только эти изменения перед переключением
+        catch_up(conf, index, target["target"], target["started"])
+        manager.swap(index, target["target"], delete_old=not args.keep_old)
+        # Записанное инкрементальным ETL в прежнюю версию между вторым проходом
+        # и переключением пропало вместе с ней, а при включённых хешах уже
+        # не будет отправлено повторно. После переключения ETL пишет в новую
+        # версию, поэтому третий проход с той же отметки закрывает разрыв
+        catch_up(conf, index, target["target"], target["started"])
+        if publisher:
+            # Догруженное должно быть видно поиску до того, как API сбросит кеш
+            manager.refresh(target["target"])
+            # Новое поколение сбрасывает кеш результатов поиска в API
+            publisher.publish(index, [])
+
+    # Псевдонимы переключены: следующая полная переиндексация начнётся с начала
+    for index, part in tasks:
+        os.remove(checkpoint_path(conf, index, part))
+    for index in args.index:
+        with contextlib.suppress(FileNotFoundError):
+            os.remove(checkpoint_path(conf, index, "catch-up"))
+    os.remove(f"{conf.file_storage}.reindex")
+
+
+if __name__ == "__main__":
+    main()
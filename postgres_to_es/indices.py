@@ -0,0 +1,191 @@
+import json
+import logging
+import os
+
+import requests
+
+from configuration import Config
+
+SCHEMAS_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "es_schemas")
+
+INDICES = ("movies", "genres", "persons")
+
+# Настройки на время массовой загрузки: без обновлений поиска и без реплик
+BULK_SETTINGS = {"refresh_interval": "-1", "number_of_replicas": 0}
+
+
+def load_schema(alias: str) -> dict:
+    with open(os.path.join(SCHEMAS_DIR, f"es_{alias}.json")) as f:
+        return json.load(f)
+
+
+class IndexManager:
+    """
+    Класс для управления версионными индексами ELK.
+
+    API и инкрементальный ETL работают с псевдонимами (movies, genres, persons),
+    а за псевдонимом стоит конкретный индекс movies_v1, movies_v2 и т.д.
+    Полная переиндексация пишет в новую версию и атомарно переключает псевдоним.
+    """
+
+    def __init__(
+        self,
+        url: str,
+        replicas: int = 1,
+        timeout: tuple[float, float] = (5, 60),
+        forcemerge_timeout: float = 3600,
+    ):
+        self.url = url
+        self.replicas = replicas
+        # (соединение, ответ) для каждого запроса: у requests таймаута по умолчанию нет
+        self.timeout = timeout
+        self.forcemerge_timeout = forcemerge_timeout
+        self.session = requests.Session()
+        self.session.headers["Content-Type"] = "application/json"
+
+    def versions(self, alias: str) -> list[str]:
+        """
+        Все версии индекса, в том числе недогруженные и не стоящие за псевдонимом
+        """
+
+        response = self.session.get(self.url + f"{alias}_v*", timeout=self.timeout)
+        response.raise_for_status()
+        return sorted(response.json(), key=lambda name: int(name.rsplit("_v", 1)[1]))
+
+    def current(self, alias: str) -> list[str]:
+        """
+        Индексы, на которые сейчас указывает псевдоним
+        """
+
+        response = self.session.get(
+            self.url + f"_alias/{alias}", timeout=self.timeout
+        )
+        if response.status_code == 404:
+            return []
+        response.raise_for_status()
+        return [
+            name
+            for name, value in response.json().items()
+            if alias in value.get("aliases", {})
+        ]
+
+    def is_concrete(self, alias: str) -> bool:
+        """
+        Индекс со старой схемой развёртывания: создан под именем псевдонима.
+        HEAD отвечает 200 и для псевдонима, поэтому имя считается индексом,
+        только если псевдоним не стоит ни на одном индексе
+        """
+
+        response = self.session.head(self.url + alias, timeout=self.timeout)
+        return response.ok and not self.current(alias)
+
+    def create(self, alias: str, bulk: bool = False) -> str:
+        """
+        Создаём следующую версию индекса по схеме из es_schemas
+        """
+
+        versions = self.versions(alias)
+        version = int(versions[-1].rsplit("_v", 1)[1]) + 1 if versions else 1
+        name = f"{alias}_v{version}"
+
+        schema = load_schema(alias)
+        schema["settings"]["number_of_replicas"] = self.replicas
+        if bulk:
+            schema["settings"].update(BULK_SETTINGS)
+
+        response = self.session.put(
+            self.url + name, data=json.dumps(schema), timeout=self.timeout
+        )
+        response.raise_for_status()
+        logging.info(f"Index {name} created")
+        return name
+
+    def finalize(self, alias: str, name: str):
+        """
+        Возвращаем рабочие настройки после загрузки и сливаем сегменты
+        """
+
+        settings = {
+            "refresh_interval": load_schema(alias)["settings"].get(
+                "refresh_interval", "1s"
+            ),
+            "number_of_replicas": self.replicas,
+        }
+        response = self.session.put(
+            self.url + f"{name}/_settings",
+            data=json.dumps({"index": settings}),
+            timeout=self.timeout,
+        )
+        response.raise_for_status()
+
+        self.refresh(name)
+        # Ответ приходит только после слияния, поэтому ждём его дольше обычного
+        self.session.post(
+            self.url + f"{name}/_forcemerge",
+            params={"max_num_segments": 1},
+            timeout=(self.timeout[0], self.forcemerge_timeout),
+        ).raise_for_status()
+        logging.info(f"Index {name} finalized")
+
+    def refresh(self, name: str):
+        self.session.post(
+            self.url + f"{name}/_refresh", timeout=self.timeout
+        ).raise_for_status()
+
+    def swap(self, alias: str, name: str, delete_old: bool = True):
+        """
+        Атомарно переключаем псевдоним на новую версию одним запросом _aliases
+        """
+
+        old = [i for i in self.current(alias) if i != name]
+        actions = [{"remove": {"index": i, "alias": alias}} for i in old]
+        if self.is_concrete(alias):
+            # Индекс со старой схемой занимает имя псевдонима: удаляем его в том же запросе
+            actions.append({"remove_index": {"index": alias}})
+        actions.append({"add": {"index": name, "alias": alias}})
+
+        response = self.session.post(
+            self.url + "_aliases",
+            data=json.dumps({"actions": actions}),
+            timeout=self.timeout,
+        )
+        response.raise_for_status()
+        logging.info(f"Alias {alias} -> {name}")
+
+        if delete_old:
+            for i in old:
+                self.session.delete(
+                    self.url + i, timeout=self.timeout
+                ).raise_for_status()
+                logging.info(f"Index {i} deleted")
+
+    def ensure(self, alias: str):
+        """
+        Первичное развёртывание: создаём первую версию и псевдоним, если их нет
+        """
+
+        if self.current(alias) or self.is_concrete(alias):
+            return
+        self.swap(alias, self.create(alias))
+
+
+def make_manager(conf: Config) -> IndexManager:
+    return IndexManager(
+        conf.es_url,
+        conf.es_replicas,
+        timeout=(conf.es_connect_timeout, conf.es_read_timeout),
+        forcemerge_timeout=conf.es_forcemerge_timeout,
+    )
+
+
+def main():
+    logging.basicConfig(level=logging.INFO)
+    conf = Config()
+    manager = make_manager(conf)
+
+    for alias in INDICES:
+        manager.ensure(alias)
+
+
+if __name__ == "__main__":
+    main()
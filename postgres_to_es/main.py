@@ -1,49 +1,339 @@
-from time import sleep
+from functools import partial
+from time import monotonic, sleep, time
 import contextlib
+import logging
 import psycopg2
-from psycopg2.extras import RealDictCursor
+from prometheus_client import start_http_server
+from redis import Redis
 
 from backoff import backoff
+from change_capture import ChangeListener
 from configuration import Config
+from content_hash import DbmHashStore, RedisHashStore, SkipUnchanged
 from es_uploader import EsUploader
-from pg_loader import PgLoader
-from queries import MOVIES, MOVIE_GENRES, MOVIE_PERSONS, GENRES, PERSONS
-from state import JsonFileStorage, State
+from metrics import ROWS_READ, mark_synced, set_watermark
+from pg_loader import PgLoader, transform
+from pipeline import Pipeline
+from publisher import ChangePublisher
+from queries import (
+    FILM_WORK_CHANGES,
+    FILMS_BY_GENRES,
+    FILMS_BY_PERSONS,
+    GENRE_CHANGES,
+    GENRES,
+    GENRES_BY_IDS,
+    MIN_ID,
+    PERSON_CHANGES,
+    PG_INDEXES,
+    PERSONS,
+    PERSONS_BY_IDS,
+)
+from state import (
+    BaseStorage,
+    Checkpoint,
+    JsonFileStorage,
+    PostgresStorage,
+    RedisStorage,
+    State,
+)
+
+# Источники изменений фильмов: по каждому собираются id затронутых фильмов
+MOVIE_SOURCES = {
+    "film_work": FILM_WORK_CHANGES,
+    "person": PERSON_CHANGES,
+    "genre": GENRE_CHANGES,
+}
 
 ENTITY = {
-    "film_work": {"query": MOVIES, "index": "movies"},
-    "person": {"query": MOVIE_PERSONS, "index": "movies"},
-    "genre": {"query": MOVIE_GENRES, "index": "movies"},
     "genres": {"query": GENRES, "index": "genres"},
     "persons": {"query": PERSONS, "index": "persons"},
 }
 
 
+def get_storage(conf: Config) -> BaseStorage:
+    if conf.state_storage == "redis":
+        return RedisStorage(
+            Redis(host=conf.redis_host, port=conf.redis_port), conf.state_key
+        )
+    if conf.state_storage == "postgres":
+        return PostgresStorage(conf.pg_dsn, conf.state_key)
+    return JsonFileStorage(file_path=conf.file_storage)
+
+
+def make_uploader(conf: Config, index: str, refresh: bool = False) -> EsUploader:
+    return EsUploader(
+        conf.es_url,
+        index,
+        max_docs=conf.es_bulk_max_docs,
+        max_bytes=conf.es_bulk_max_bytes,
+        compress=conf.es_bulk_compress,
+        retries=conf.es_bulk_retries,
+        pool_size=conf.es_writers,
+        timeout=(conf.es_connect_timeout, conf.es_read_timeout),
+        refresh=refresh,
+    )
+
+
+def make_publisher(conf: Config) -> ChangePublisher | None:
+    if not conf.redis_host:
+        return None
+    return ChangePublisher(
+        Redis(host=conf.redis_host, port=conf.redis_port),
+        conf.cache_invalidation_channel,
+    )
+
+
+def make_skipper(conf: Config) -> SkipUnchanged | None:
+    if conf.content_hash_store == "redis":
+        store = RedisHashStore(
+            Redis(host=conf.redis_host, port=conf.redis_port), conf.state_key
+        )
+    elif conf.content_hash_store == "dbm":
+        store = DbmHashStore(conf.content_hash_file)
+    else:
+        return None
+    return SkipUnchanged(store, force=conf.force_full_refresh)
+
+
+def make_upload(
+    conf: Config,
+    publisher: ChangePublisher | None,
+    index: str,
+    skipper: SkipUnchanged | None = None,
+):
+    uploader = make_uploader(conf, index, refresh=publisher is not None)
+
+    def upload(data):
+        if skipper:
+            data, hashes = skipper.filter(index, data)
+        failed = uploader.upload(data) if data else set()
+        written = [x.id for x in data if x.id not in failed]
+        if publisher and written:
+            publisher.publish(index, written)
+        if skipper:
+            # Отвергнутые ELK документы не запоминаем: следующий проход
+            # отправит их снова, а не посчитает неизменившимися
+            skipper.remember(
+                index, {k: v for k, v in hashes.items() if k not in failed}
+            )
+
+    return upload
+
+
+def make_uploads(conf: Config, skipper: SkipUnchanged | None = None) -> dict:
+    """
+    Загрузка по индексам создаётся один раз на процесс: сессии requests
+    и клиент Redis живут всё время работы и переиспользуют соединения
+    между проходами, а не открываются заново на каждый цикл
+    """
+
+    publisher = make_publisher(conf)
+    indices = ("movies", *(ENTITY[i]["index"] for i in ENTITY))
+    return {index: make_upload(conf, publisher, index, skipper) for index in indices}
+
+
 @backoff(start_sleep_time=0.1, factor=2, border_sleep_time=10)
-def run(conf: Config):
+def prepare_pg(conf: Config):
+    """
+    Индексы PG, на которые рассчитаны запросы обогащения
+    """
+
+    with contextlib.closing(psycopg2.connect(dsn=conf.pg_dsn)) as conn, conn:
+        with conn.cursor() as cur:
+            cur.execute(PG_INDEXES)
+
+
+def make_pipeline(conf: Config, index: str, upload, commit) -> Pipeline:
+    return Pipeline(
+        transform=partial(transform, index),
+        upload=upload,
+        commit=commit,
+        transform_workers=conf.transform_workers,
+        writers=conf.es_writers,
+        queue_size=conf.queue_size,
+        name=index,
+    )
+
+
+def collect_movie_changes(
+    conf: Config, loader: PgLoader, state: State, modified: str
+) -> tuple[set[str], dict[str, list[str]], bool]:
+    """
+    Собираем id фильмов, затронутых изменениями во всех источниках.
+    Возвращаем id, новые отметки источников и признак, что изменений больше нет
+    """
+
+    film_ids = set()
+    watermarks = {}
+    drained = True
+
+    for source, query in MOVIE_SOURCES.items():
+        updated_at, last_id = state.get_state(source) or (modified, MIN_ID)
+        rows = loader.fetch(
+            query,
+            {"updated_at": updated_at, "id": last_id, "limit": conf.collect_limit},
+        )
+        ROWS_READ.labels(source).inc(len(rows))
+        if not rows:
+            continue
+
+        film_ids.update(film_id for _, _, film_id in rows if film_id)
+        watermarks[source] = [str(rows[-1][1]), str(rows[-1][0])]
+        if len({source_id for source_id, _, _ in rows}) >= conf.collect_limit:
+            drained = False
+
+    return film_ids, watermarks, drained
+
+
+def load_movies(conf: Config, loader: PgLoader, state: State, modified: str, upload):
+    """
+    Фильмы загружаются циклами: сначала собираются id из всех источников,
+    затем каждый затронутый фильм собирается и загружается ровно один раз
+    """
+
+    started = time()
+
+    while True:
+        film_ids, watermarks, drained = collect_movie_changes(
+            conf, loader, state, modified
+        )
+
+        if film_ids:
+            pipeline = make_pipeline(conf, "movies", upload, commit=lambda _: None)
+            pipeline.run(loader.enrich("movies", loader.id_batches(sorted(film_ids))))
+
+        # Отметки источников сдвигаются только после записи всех собранных фильмов
+        for source, watermark in watermarks.items():
+            state.set_state(source, watermark)
+            set_watermark(source, watermark[0])
+
+        if drained:
+            for source in MOVIE_SOURCES:
+                mark_synced(source, started)
+            return
+
+
+def load_entity(
+    conf: Config, loader: PgLoader, state: State, modified: str, entity: str, upload
+):
+    index = ENTITY[entity]["index"]
+
+    # У каждой сущности своя отметка (updated_at, id)
+    updated_at, last_id = state.get_state(entity) or (modified, MIN_ID)
+    checkpoint = Checkpoint(state, entity, conf.state_commit_interval)
+    started = time()
+
+    def commit(watermark):
+        checkpoint.commit([str(v) for v in watermark])
+        set_watermark(entity, watermark[0])
+
+    pipeline = make_pipeline(conf, index, upload, commit=commit)
+
+    try:
+        pipeline.run(
+            loader.enrich(
+                index,
+                loader.read_rows(
+                    ENTITY[entity]["query"],
+                    {"updated_at": updated_at, "id": last_id},
+                    entity=entity,
+                ),
+            )
+        )
+    finally:
+        # Состояние сдвигается только до пачек, которые точно записаны в ELK
+        checkpoint.flush()
+
+    mark_synced(entity, started)
+
+
+@backoff(start_sleep_time=0.1, factor=2, border_sleep_time=10)
+def run(conf: Config, uploads: dict):
     try:
-        with psycopg2.connect(dsn=conf.pg_dsn) as conn, conn.cursor(
-            cursor_factory=RealDictCursor
-        ) as cur:
-            loader = PgLoader(cur, conf.pack_size)
-            state = State(JsonFileStorage(file_path=conf.file_storage))
+        with psycopg2.connect(dsn=conf.pg_dsn) as conn:
+            loader = PgLoader(conn, conf.pack_size, conf.pg_itersize)
+            state = State(get_storage(conf))
+            # Отметка общего формата из прошлых версий служит началом для всех сущностей
             modified = state.get_state("modified") or conf.start_date
 
-            for i in ENTITY:
-                uploader = EsUploader(conf.es_url, ENTITY[i]["index"])
+            load_movies(conf, loader, state, modified, uploads["movies"])
 
-                for data, last_updated in loader.read_data(
-                    ENTITY[i]["query"], modified, ENTITY[i]["index"]
-                ):
-                    uploader.upload(data)
+            for i in ENTITY:
+                load_entity(
+                    conf, loader, state, modified, i, uploads[ENTITY[i]["index"]]
+                )
 
     finally:
         with contextlib.suppress(NameError):
-            state.set_state("modified", str(last_updated))
             conn.close()
-        sleep(conf.sleep_time)
+
+
+@backoff(start_sleep_time=0.1, factor=2, border_sleep_time=10)
+def run_changes(conf: Config, changes: dict[str, set[str]], uploads: dict):
+    """
+    Загрузка только записей, о которых сообщили триггеры, без сканирования таблиц.
+    Отметки не сдвигаются: их догонит следующий обычный проход
+    """
+
+    with contextlib.closing(psycopg2.connect(dsn=conf.pg_dsn)) as conn, conn:
+        loader = PgLoader(conn, conf.pack_size, conf.pg_itersize)
+
+        film_ids = set(changes.get("film_work", ()))
+        for table, query in (("person", FILMS_BY_PERSONS), ("genre", FILMS_BY_GENRES)):
+            if changes.get(table):
+                rows = loader.fetch(query, {"ids": list(changes[table])})
+                ROWS_READ.labels(table).inc(len(rows))
+                film_ids.update(film_id for film_id, in rows)
+
+        batches = {
+            "movies": loader.enrich("movies", loader.id_batches(sorted(film_ids))),
+            "persons": loader.enrich(
+                "persons",
+                loader.read_by_ids(
+                    PERSONS_BY_IDS, sorted(changes.get("person", ())), "persons"
+                ),
+            ),
+            "genres": loader.read_by_ids(
+                GENRES_BY_IDS, sorted(changes.get("genre", ())), "genres"
+            ),
+        }
+
+        for index, index_batches in batches.items():
+            pipeline = make_pipeline(
+                conf, index, uploads[index], commit=lambda _: None
+            )
+            pipeline.run(index_batches)
+
+
+def listen(conf: Config, uploads: dict):
+    """
+    Режим захвата изменений: ETL просыпается по уведомлениям PG,
+    а обычный проход по отметкам выполняется раз в poll_interval
+    """
+
+    listener = ChangeListener(conf.pg_dsn, conf.change_channel, conf.change_window)
+
+    while True:
+        run(conf, uploads)
+
+        deadline = monotonic() + conf.poll_interval
+        while (left := deadline - monotonic()) > 0:
+            if changes := listener.wait(left):
+                run_changes(conf, changes, uploads)
 
 
 if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO)
+    conf = Config()
+    if conf.metrics_port:
+        start_http_server(conf.metrics_port)
+    prepare_pg(conf)
+    # Хранилище хешей и загрузчики открываются один раз на весь процесс
+    uploads = make_uploads(conf, make_skipper(conf))
+
+    if conf.change_capture:
+        listen(conf, uploads)
+
     while True:
-        run(Config())
+        run(conf, uploads)
+        sleep(conf.sleep_time)
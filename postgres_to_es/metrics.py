@@ -0,0 +1,78 @@
+import time
+from datetime import datetime, timezone
+
+from prometheus_client import Counter, Gauge, Histogram
+
+# Границы гистограмм: размер пачки в документах и время запросов в секундах
+BATCH_SIZE_BUCKETS = (1, 10, 50, 100, 250, 500, 1000, 2500, 5000, 10000)
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30)
+
+ROWS_READ = Counter(
+    "etl_rows_read_total",
+    "Строки, прочитанные из PG: по источнику изменений фильмов или сущности",
+    ["entity"],
+)
+DOCS_INDEXED = Counter("etl_docs_indexed_total", "Документы, записанные в ELK", ["index"])
+DOCS_FAILED = Counter(
+    "etl_docs_failed_total", "Документы, которые ELK так и не принял", ["index"]
+)
+DOCS_SKIPPED = Counter(
+    "etl_docs_skipped_total", "Неизменившиеся документы, не отправленные в ELK", ["index"]
+)
+DOCS_RETRIED = Counter(
+    "etl_docs_retried_total", "Документы, повторно отправленные после 429/5xx", ["index"]
+)
+RETRIES = Counter("etl_retries_total", "Повторы после ошибок (backoff)", ["operation"])
+
+BATCH_SIZE = Histogram(
+    "etl_batch_size_docs", "Размер пачки", ["entity"], buckets=BATCH_SIZE_BUCKETS
+)
+STAGE_SECONDS = Histogram(
+    "etl_stage_seconds",
+    "Время стадии конвейера на одну пачку",
+    ["entity", "stage"],
+    buckets=LATENCY_BUCKETS,
+)
+PG_QUERY_SECONDS = Histogram(
+    "etl_pg_query_seconds", "Время запросов к PG", ["method"], buckets=LATENCY_BUCKETS
+)
+BULK_SECONDS = Histogram(
+    "etl_bulk_request_seconds",
+    "Время одного запроса _bulk",
+    ["index"],
+    buckets=LATENCY_BUCKETS,
+)
+
+QUEUE_DEPTH = Gauge("etl_queue_depth", "Заполненность очередей конвейера", ["entity", "queue"])
+WATERMARK = Gauge(
+    "etl_watermark_timestamp_seconds",
+    "updated_at сохранённой отметки сущности",
+    ["entity"],
+)
+INDEXING_LAG = Gauge(
+    "etl_indexing_lag_seconds",
+    "Сколько секунд назад ELK последний раз догонял PG по сущности",
+    ["entity"],
+)
+
+# Когда начался последний проход, после которого сущность догнала PG
+_synced_at: dict[str, float] = {}
+
+
+def set_watermark(entity: str, updated_at: str):
+    value = datetime.fromisoformat(str(updated_at))
+    if value.tzinfo is None:
+        value = value.replace(tzinfo=timezone.utc)
+    WATERMARK.labels(entity).set(value.timestamp())
+
+
+def mark_synced(entity: str, started: float):
+    """
+    Всё, что изменилось до started, уже в ELK: отставание считается от этого момента
+    """
+
+    if entity not in _synced_at:
+        INDEXING_LAG.labels(entity).set_function(
+            lambda: time.time() - _synced_at[entity]
+        )
+    _synced_at[entity] = started
@@ -1,34 +1,195 @@
-from psycopg2._psycopg import cursor as Cursor
+from collections import defaultdict
+from itertools import islice
+from typing import NamedTuple
+from uuid import uuid4
 
-from backoff import backoff
-from models import Movie, Genre, Person
-from utils import transform_movie_data, transform_person_data
+import orjson
+from psycopg2.extensions import connection as Connection
 
+from metrics import PG_QUERY_SECONDS, ROWS_READ
+from queries import (
+    FILM_GENRES_BY_IDS,
+    FILM_PERSONS_BY_IDS,
+    FILMS_BY_IDS,
+    PERSON_FILMS_BY_IDS,
+)
+from utils import genre_document, movie_document, person_document
 
+# Документы собираются простыми словарями без моделей pydantic:
+# состав полей совпадает с models.Movie, models.Genre и models.Person
 MAPPERS = {
-    "movies": lambda x: Movie(**transform_movie_data(x)),
-    "genres": lambda x: Genre(**x),
-    "persons": lambda x: Person(**transform_person_data(x)),
+    "movies": movie_document,
+    "genres": genre_document,
+    "persons": person_document,
 }
 
+# Колонки строк фильма после обогащения: FILMS_BY_IDS + persons и genres
+MOVIE_COLUMNS = {
+    name: i
+    for i, name in enumerate(
+        ("id", "title", "description", "rating", "type", "updated_at", "persons", "genres")
+    )
+}
+
+
+class Batch(NamedTuple):
+    """
+    Пачка строк из PG: строки — обычные кортежи, columns — номер колонки по имени
+    """
+
+    columns: dict[str, int]
+    rows: list[tuple]
+
+
+class Document(NamedTuple):
+    """
+    Документ индекса: id и уже сериализованное тело для _bulk
+    """
+
+    id: str
+    source: bytes
+
 
 class PgLoader:
     """
     Класс для работы с PG
     """
 
-    def __init__(self, cursor: Cursor, pack_size: int):
-        self.cursor = cursor
+    def __init__(self, connection: Connection, pack_size: int, itersize: int):
+        self.connection = connection
         self.pack_size = pack_size
+        self.itersize = itersize
+
+    def read_rows(
+        self,
+        sql_query: str,
+        params,
+        watermark: tuple[str, ...] = ("updated_at", "id"),
+        entity: str | None = None,
+    ):
+        """
+        Читаем строки пачками, вместе с пачкой отдаём значения колонок
+        watermark из её последней строки. Прочитанные строки считаются
+        в etl_rows_read_total с меткой entity.
+
+        Используется именованный (серверный) курсор: строки приходят с сервера
+        порциями по itersize, поэтому память не зависит от размера выборки
+        """
+
+        with self.connection.cursor(name=f"etl_{uuid4().hex}") as cursor:
+            cursor.itersize = self.itersize
+            cursor.execute(sql_query.lower(), params)
+            columns = None
+
+            while True:
+                # Серверный курсор: время запроса — это время чтения каждой порции
+                with PG_QUERY_SECONDS.labels("read_rows").time():
+                    rows = list(islice(cursor, self.pack_size))
+                if not rows:
+                    break
+                if entity:
+                    ROWS_READ.labels(entity).inc(len(rows))
+
+                # У серверного курсора описание колонок есть только после первого чтения
+                if columns is None:
+                    columns = {c.name: i for i, c in enumerate(cursor.description)}
+
+                yield Batch(columns, rows), tuple(
+                    rows[-1][columns[name]] for name in watermark
+                )
+
+    def fetch(self, sql_query: str, params) -> list[tuple]:
+        """
+        Небольшая выборка целиком, например id изменённых записей
+        """
 
-    @backoff(start_sleep_time=0.1, factor=2, border_sleep_time=10)
-    def read_data(self, sql_query: str, modified: str, index: str):
-        self.cursor.execute(sql_query.lower(), (modified,))
+        with self.connection.cursor() as cursor, PG_QUERY_SECONDS.labels(
+            "fetch"
+        ).time():
+            cursor.execute(sql_query.lower(), params)
+            return cursor.fetchall()
 
-        while rows := self.cursor.fetchmany(self.pack_size):
-            data = list()
+    def id_batches(self, ids: list[str]):
+        """
+        Разбиваем список id на пачки по pack_size для последующего обогащения
+        """
 
-            for row in rows:
-                data.append(MAPPERS[index](row))
+        for start in range(0, len(ids), self.pack_size):
+            rows = [(i,) for i in ids[start : start + self.pack_size]]
+            yield Batch({"id": 0}, rows), None
+
+    def read_by_ids(self, sql_query: str, ids: list[str], entity: str | None = None):
+        """
+        Читаем записи по списку id пачками по pack_size
+        """
+
+        for start in range(0, len(ids), self.pack_size):
+            with self.connection.cursor() as cursor, PG_QUERY_SECONDS.labels(
+                "read_by_ids"
+            ).time():
+                cursor.execute(
+                    sql_query.lower(), {"ids": ids[start : start + self.pack_size]}
+                )
+                columns = {c.name: i for i, c in enumerate(cursor.description)}
+                rows = cursor.fetchall()
+            if entity:
+                ROWS_READ.labels(entity).inc(len(rows))
+            yield Batch(columns, rows), None
+
+    def enrich(self, index: str, batches):
+        """
+        Вторая фаза выборки: к пачке id (и основных полей) догружаем связанные
+        записи узкими запросами по этим id и объединяем их здесь, а не в PG
+        """
+
+        enricher = ENRICHERS.get(index)
+        for batch, watermark in batches:
+            yield (enricher(self, batch) if enricher else batch), watermark
+
+    def _enrich_movies(self, batch: Batch) -> Batch:
+        params = {"ids": [row[batch.columns["id"]] for row in batch.rows]}
+
+        persons = defaultdict(list)
+        for film_id, role, person_id, name in self.fetch(FILM_PERSONS_BY_IDS, params):
+            persons[film_id].append(
+                {"person_role": role, "person_id": person_id, "person_name": name}
+            )
+
+        genres = defaultdict(list)
+        for film_id, name in self.fetch(FILM_GENRES_BY_IDS, params):
+            genres[film_id].append(name)
+
+        rows = [
+            film + (persons[film[0]], sorted(genres[film[0]]))
+            for film in self.fetch(FILMS_BY_IDS, params)
+        ]
+        return Batch(MOVIE_COLUMNS, rows)
+
+    def _enrich_persons(self, batch: Batch) -> Batch:
+        params = {"ids": [row[batch.columns["id"]] for row in batch.rows]}
+
+        films = defaultdict(list)
+        for person_id, film_id, role in self.fetch(PERSON_FILMS_BY_IDS, params):
+            films[person_id].append({"id": film_id, "role": role})
+
+        columns = batch.columns | {"films": len(batch.columns)}
+        rows = [row + (films[row[batch.columns["id"]]],) for row in batch.rows]
+        return Batch(columns, rows)
+
+
+ENRICHERS = {
+    "movies": PgLoader._enrich_movies,
+    "persons": PgLoader._enrich_persons,
+}
+
+
+def transform(index: str, batch: Batch) -> list[Document]:
+    """
+    Преобразуем строки из PG в документы индекса, сразу сериализуя их в json
+    """
 
-            yield data, rows[-1]["updated_at"]
+    mapper = MAPPERS[index]
+    return [
+        Document(row[batch.columns["id"]], orjson.dumps(mapper(row, batch.columns)))
+        for row in batch.rows
+    ]
@@ -0,0 +1,208 @@
+import logging
+import queue
+import threading
+import time
+from collections import defaultdict
+from typing import Any, Callable, Iterable
+
+from metrics import BATCH_SIZE, QUEUE_DEPTH, STAGE_SECONDS
+
+# Как часто заблокированные на очереди потоки проверяют, не упал ли конвейер
+POLL_INTERVAL = 0.1
+
+
+class StageStats:
+    """
+    Суммарное время и число элементов по стадиям всех конвейеров процесса.
+    Время стадии — сумма по её потокам, ожидание очередей не учитывается
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.reset()
+
+    def reset(self):
+        with self._lock:
+            self.seconds = defaultdict(float)
+            self.items = defaultdict(int)
+
+    def add(self, stage: str, seconds: float, items: int):
+        with self._lock:
+            self.seconds[stage] += seconds
+            self.items[stage] += items
+
+    def snapshot(self) -> dict[str, dict]:
+        with self._lock:
+            return {
+                stage: {"seconds": self.seconds[stage], "items": self.items[stage]}
+                for stage in self.seconds
+            }
+
+
+stats = StageStats()
+
+
+class PipelineError(Exception):
+    """Ошибка в одной из стадий конвейера"""
+
+
+class Pipeline:
+    """
+    Конвейер загрузки: чтение из PG -> преобразование -> запись в ELK.
+
+    Стадии работают одновременно и связаны очередями ограниченного размера:
+    если запись в ELK не успевает, чтение из PG приостанавливается.
+    Пачки могут записываться не по порядку, но commit вызывается строго
+    по порядку чтения и только для пачек, перед которыми всё уже записано.
+    """
+
+    def __init__(
+        self,
+        transform: Callable[[list], list],
+        upload: Callable[[list], Any],
+        commit: Callable[[Any], Any],
+        transform_workers: int = 2,
+        writers: int = 4,
+        queue_size: int = 8,
+        name: str = "",
+    ):
+        self.name = name
+        self.transform = transform
+        self.upload = upload
+        self.commit = commit
+        self.transform_workers = transform_workers
+        self.writers = writers
+        self.queue_size = queue_size
+
+    def run(self, batches: Iterable[tuple[list, Any]]):
+        """
+        batches — пачки строк вместе с отметкой (watermark), до которой
+        можно сдвинуть состояние после записи пачки
+        """
+
+        self._error: BaseException | None = None
+        self._failed = threading.Event()
+        self._raw = queue.Queue(self.queue_size)
+        self._docs = queue.Queue(self.queue_size)
+        self._done: dict[int, Any] = {}
+        self._next_commit = 0
+        self._commit_lock = threading.Lock()
+
+        transformers = self._start(self._transform_worker, self.transform_workers)
+        writers = self._start(self._write_worker, self.writers)
+
+        try:
+            # Чтение идёт в текущем потоке: курсор PG нельзя делить между потоками
+            batches = iter(batches)
+            seq = 0
+            while True:
+                started = time.perf_counter()
+                item = next(batches, None)
+                self._measure("read", started, item is not None)
+                if item is None:
+                    break
+
+                rows, watermark = item
+                if not self._put(self._raw, (seq, rows, watermark)):
+                    break
+                seq += 1
+        except BaseException as ex:
+            self._fail(ex)
+        finally:
+            self._stop(self._raw, transformers)
+            self._stop(self._docs, writers)
+            # Потоки остановлены и очереди пусты: без этого после прохода
+            # метрика так и показывала бы последнюю (обычно полную) глубину
+            self._track(self._raw)
+            self._track(self._docs)
+
+        if self._error is not None:
+            raise PipelineError(str(self._error)) from self._error
+
+    def _measure(self, stage: str, started: float, items: int):
+        seconds = time.perf_counter() - started
+        stats.add(stage, seconds, items)
+        STAGE_SECONDS.labels(self.name, stage).observe(seconds)
+
+    def _start(self, target, count) -> list[threading.Thread]:
+        threads = [threading.Thread(target=target, daemon=True) for _ in range(count)]
+        for thread in threads:
+            thread.start()
+        return threads
+
+    def _stop(self, q: queue.Queue, threads: list[threading.Thread]):
+        for _ in threads:
+            self._put(q, None, force=True)
+        for thread in threads:
+            thread.join()
+
+    def _put(self, q: queue.Queue, item, force=False) -> bool:
+        # Ждём места в очереди, пока конвейер не упал
+        while force or not self._failed.is_set():
+            try:
+                q.put(item, timeout=POLL_INTERVAL)
+                self._track(q)
+                return True
+            except queue.Full:
+                if force and self._failed.is_set():
+                    self._drain(q)
+        return False
+
+    def _get(self, q: queue.Queue):
+        item = q.get()
+        self._track(q)
+        return item
+
+    def _track(self, q: queue.Queue):
+        QUEUE_DEPTH.labels(self.name, "raw" if q is self._raw else "docs").set(
+            q.qsize()
+        )
+
+    @staticmethod
+    def _drain(q: queue.Queue):
+        while True:
+            try:
+                q.get_nowait()
+            except queue.Empty:
+                return
+
+    def _fail(self, ex: BaseException):
+        logging.error(f"Pipeline stage failed: {ex}")
+        if self._error is None:
+            self._error = ex
+        self._failed.set()
+
+    def _transform_worker(self):
+        while (item := self._get(self._raw)) is not None:
+            if self._failed.is_set():
+                continue
+            seq, rows, watermark = item
+            try:
+                started = time.perf_counter()
+                docs = self.transform(rows)
+                self._measure("transform", started, len(docs))
+                BATCH_SIZE.labels(self.name).observe(len(docs))
+            except Exception as ex:
+                self._fail(ex)
+                continue
+            self._put(self._docs, (seq, docs, watermark))
+
+    def _write_worker(self):
+        while (item := self._get(self._docs)) is not None:
+            if self._failed.is_set():
+                continue
+            seq, docs, watermark = item
+            try:
+                started = time.perf_counter()
+                self.upload(docs)
+                self._measure("upload", started, len(docs))
+                self._confirm(seq, watermark)
+            except Exception as ex:
+                self._fail(ex)
+
+    def _confirm(self, seq: int, watermark):
+        with self._commit_lock:
+            self._done[seq] = watermark
+            while self._next_commit in self._done:
+                self.commit(self._done.pop(self._next_commit))
+                self._next_commit += 1
@@ -0,0 +1,30 @@
+import json
+import logging
+
+from redis import Redis
+from redis.exceptions import RedisError
+
+
+class ChangePublisher:
+    """
+    Класс для оповещения API об изменённых документах.
+
+    После загрузки пачки в ELK увеличивает счётчик поколений индекса
+    и публикует id документов в канал Redis. API по этому сообщению
+    удаляет документы из своих кешей.
+    """
+
+    def __init__(self, redis: Redis, channel: str):
+        self.redis = redis
+        self.channel = channel
+
+    def publish(self, index: str, ids: list[str]):
+        try:
+            generation = self.redis.incr(f"cache-gen-{index}")
+            self.redis.publish(
+                self.channel,
+                json.dumps({"index": index, "ids": ids, "generation": generation}),
+            )
+        except RedisError as ex:
+            # Кеш API всё равно устареет по TTL, останавливать загрузку не стоит
+            logging.error(f"Failed to publish changes for {index}: {ex}")
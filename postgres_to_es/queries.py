@@ -1,65 +1,103 @@
-__GENERAL = """
+# uuid меньше любого id: начальное значение для чтения по (updated_at, id)
+MIN_ID = "00000000-0000-0000-0000-000000000000"
+
+# Сбор изменений: из каждого источника читается не больше limit изменённых
+# записей по (updated_at, id) и id фильмов, которые они затрагивают
+
+__CHANGED = """
+    WITH CHANGED AS (
+        SELECT ID, UPDATED_AT
+        FROM CONTENT.{table}
+        WHERE (UPDATED_AT, ID) > (%(updated_at)s::TIMESTAMPTZ, %(id)s::UUID)
+        ORDER BY UPDATED_AT, ID
+        LIMIT %(limit)s
+    )
+"""
+
+FILM_WORK_CHANGES = (
+    __CHANGED.format(table="FILM_WORK")
+    + """
+    SELECT C.ID, C.UPDATED_AT, C.ID AS FILM_WORK_ID
+    FROM CHANGED C
+    ORDER BY C.UPDATED_AT, C.ID
+"""
+)
+
+PERSON_CHANGES = (
+    __CHANGED.format(table="PERSON")
+    + """
+    SELECT C.ID, C.UPDATED_AT, PFW.FILM_WORK_ID
+    FROM CHANGED C
+    LEFT JOIN CONTENT.PERSON_FILM_WORK PFW ON PFW.PERSON_ID = C.ID
+    ORDER BY C.UPDATED_AT, C.ID
+"""
+)
+
+GENRE_CHANGES = (
+    __CHANGED.format(table="GENRE")
+    + """
+    SELECT C.ID, C.UPDATED_AT, GFW.FILM_WORK_ID
+    FROM CHANGED C
+    LEFT JOIN CONTENT.GENRE_FILM_WORK GFW ON GFW.GENRE_ID = C.ID
+    ORDER BY C.UPDATED_AT, C.ID
+"""
+)
+
+# Обогащение пачки фильмов: узкие запросы по id, результаты
+# объединяются в PgLoader, без группировки на стороне PG.
+# ORDER BY обязателен: порядок вложенных списков не должен зависеть от плана
+# и от соседей по пачке, иначе меняется хеш неизменившегося документа
+
+FILMS_BY_IDS = """
     SELECT
         FW.ID,
         FW.TITLE,
         FW.DESCRIPTION,
         FW.RATING,
         FW.TYPE,
-        FW.UPDATED_AT,
-        COALESCE (
-            JSON_AGG(
-                DISTINCT JSONB_BUILD_OBJECT(
-                    'PERSON_ROLE', PFW.ROLE,
-                    'PERSON_ID', P.ID,
-                    'PERSON_NAME', P.FULL_NAME
-                )
-            ) FILTER (WHERE P.ID IS NOT NULL),
-            '[]'
-        ) AS PERSONS,
-        ARRAY_AGG(DISTINCT G.NAME) AS GENRES
-"""
-
-MOVIES = (
-    __GENERAL
-    + """
+        FW.UPDATED_AT
     FROM CONTENT.FILM_WORK FW
-    LEFT JOIN CONTENT.PERSON_FILM_WORK PFW ON PFW.FILM_WORK_ID = FW.ID
-    LEFT JOIN CONTENT.PERSON P ON P.ID = PFW.PERSON_ID
-    LEFT JOIN CONTENT.GENRE_FILM_WORK GFW ON GFW.FILM_WORK_ID = FW.ID
-    LEFT JOIN CONTENT.GENRE G ON G.ID = GFW.GENRE_ID
-    WHERE FW.UPDATED_AT > %s
-    GROUP BY FW.ID
-    ORDER BY MAX(FW.UPDATED_AT), FW.ID;
+    WHERE FW.ID = ANY(%(ids)s::UUID[])
 """
-)
 
-MOVIE_PERSONS = (
-    __GENERAL
-    + """
-    FROM CONTENT.PERSON P
-    LEFT JOIN CONTENT.PERSON_FILM_WORK PFW ON PFW.PERSON_ID = P.ID
-    LEFT JOIN CONTENT.FILM_WORK FW ON FW.ID = PFW.FILM_WORK_ID
-    LEFT JOIN CONTENT.GENRE_FILM_WORK GFW ON GFW.FILM_WORK_ID = FW.ID
-    LEFT JOIN CONTENT.GENRE G ON G.ID = GFW.GENRE_ID
-    WHERE P.UPDATED_AT > %s
-    GROUP BY FW.ID
-    ORDER BY MAX(P.UPDATED_AT), FW.ID;
+FILM_PERSONS_BY_IDS = """
+    SELECT DISTINCT
+        PFW.FILM_WORK_ID,
+        PFW.ROLE,
+        P.ID,
+        P.FULL_NAME
+    FROM CONTENT.PERSON_FILM_WORK PFW
+    JOIN CONTENT.PERSON P ON P.ID = PFW.PERSON_ID
+    WHERE PFW.FILM_WORK_ID = ANY(%(ids)s::UUID[])
+    ORDER BY PFW.FILM_WORK_ID, PFW.ROLE, P.ID
 """
-)
 
-MOVIE_GENRES = (
-    __GENERAL
-    + """
-    FROM CONTENT.GENRE G
-    LEFT JOIN CONTENT.GENRE_FILM_WORK GFW ON GFW.GENRE_ID = G.ID
-    LEFT JOIN CONTENT.FILM_WORK FW ON FW.ID = GFW.FILM_WORK_ID
-    LEFT JOIN CONTENT.PERSON_FILM_WORK PFW ON PFW.FILM_WORK_ID = FW.ID
-    LEFT JOIN CONTENT.PERSON P ON P.ID = PFW.PERSON_ID
-    WHERE G.UPDATED_AT > %s
-    GROUP BY FW.ID
-    ORDER BY MAX(G.UPDATED_AT), FW.ID;
+FILM_GENRES_BY_IDS = """
+    SELECT DISTINCT
+        GFW.FILM_WORK_ID,
+        G.NAME
+    FROM CONTENT.GENRE_FILM_WORK GFW
+    JOIN CONTENT.GENRE G ON G.ID = GFW.GENRE_ID
+    WHERE GFW.FILM_WORK_ID = ANY(%(ids)s::UUID[])
+"""
+
+PERSON_FILMS_BY_IDS = """
+    SELECT DISTINCT
+        PFW.PERSON_ID,
+        PFW.FILM_WORK_ID,
+        PFW.ROLE
+    FROM CONTENT.PERSON_FILM_WORK PFW
+    WHERE PFW.PERSON_ID = ANY(%(ids)s::UUID[])
+    ORDER BY PFW.PERSON_ID, PFW.FILM_WORK_ID, PFW.ROLE
+"""
+
+# Индекс для PERSON_FILMS_BY_IDS. В схеме есть только (film_work_id, person_id),
+# и без этого индекса каждая пачка персон читала бы всю person_film_work.
+# film_work_id и role включены, чтобы запрос обходился чтением индекса
+PG_INDEXES = """
+    CREATE INDEX IF NOT EXISTS person_film_work_person_idx
+        ON content.person_film_work (person_id, film_work_id, role)
 """
-)
 
 GENRES = """
     SELECT 
@@ -69,20 +107,149 @@ GENRES = """
         ,CREATED_AT
         ,UPDATED_AT
 	FROM CONTENT.GENRE
-        WHERE UPDATED_AT > %s 
+        WHERE (UPDATED_AT, ID) > (%(updated_at)s::TIMESTAMPTZ, %(id)s::UUID)
+    ORDER BY UPDATED_AT, ID
 """
 
 PERSONS = """
     SELECT
         P.ID,
         P.FULL_NAME,
-        P.UPDATED_AT,
-        ARRAY_AGG(
-            DISTINCT JSONB_BUILD_OBJECT('ID', PFW.FILM_WORK_ID, 'ROLE', PFW.ROLE)
-        ) FILTER (WHERE P.ID = PFW.PERSON_ID) AS FILMS
+        P.UPDATED_AT
     FROM CONTENT.PERSON P
-    LEFT JOIN CONTENT.PERSON_FILM_WORK PFW ON P.ID = PFW.PERSON_ID
-        WHERE P.UPDATED_AT > %s
-    GROUP BY P.ID
-    ORDER BY P.UPDATED_AT
+        WHERE (P.UPDATED_AT, P.ID) > (%(updated_at)s::TIMESTAMPTZ, %(id)s::UUID)
+    ORDER BY P.UPDATED_AT, P.ID
 """
+
+# Загрузка по id, пришедшим из LISTEN/NOTIFY
+
+FILMS_BY_PERSONS = """
+    SELECT DISTINCT PFW.FILM_WORK_ID
+    FROM CONTENT.PERSON_FILM_WORK PFW
+    WHERE PFW.PERSON_ID = ANY(%(ids)s::UUID[])
+"""
+
+FILMS_BY_GENRES = """
+    SELECT DISTINCT GFW.FILM_WORK_ID
+    FROM CONTENT.GENRE_FILM_WORK GFW
+    WHERE GFW.GENRE_ID = ANY(%(ids)s::UUID[])
+"""
+
+PERSONS_BY_IDS = """
+    SELECT
+        P.ID,
+        P.FULL_NAME,
+        P.UPDATED_AT
+    FROM CONTENT.PERSON P
+    WHERE P.ID = ANY(%(ids)s::UUID[])
+"""
+
+GENRES_BY_IDS = """
+    SELECT
+        ID
+        ,NAME
+        ,DESCRIPTION
+        ,CREATED_AT
+        ,UPDATED_AT
+    FROM CONTENT.GENRE
+    WHERE ID = ANY(%(ids)s::UUID[])
+"""
+
+# Триггеры захвата изменений: каждое изменение в content.* отправляет
+# в канал channel сообщение {"table": ..., "id": ...}. Изменения связей
+# фильмов с персонами и жанрами приходят как изменения фильма (и персоны)
+CHANGE_CAPTURE_TRIGGERS = """
+CREATE OR REPLACE FUNCTION content.etl_notify_change() RETURNS trigger AS $$
+DECLARE
+    rec RECORD;
+BEGIN
+    IF TG_OP = 'DELETE' THEN
+        rec := OLD;
+    ELSE
+        rec := NEW;
+    END IF;
+
+    IF TG_TABLE_NAME = 'person_film_work' THEN
+        PERFORM pg_notify('{channel}', json_build_object('table', 'film_work', 'id', rec.film_work_id)::text);
+        PERFORM pg_notify('{channel}', json_build_object('table', 'person', 'id', rec.person_id)::text);
+    ELSIF TG_TABLE_NAME = 'genre_film_work' THEN
+        PERFORM pg_notify('{channel}', json_build_object('table', 'film_work', 'id', rec.film_work_id)::text);
+    ELSE
+        PERFORM pg_notify('{channel}', json_build_object('table', TG_TABLE_NAME, 'id', rec.id)::text);
+    END IF;
+
+    RETURN NULL;
+END;
+$$ LANGUAGE plpgsql;
+
+DROP TRIGGER IF EXISTS etl_notify_change ON content.film_work;
+CREATE TRIGGER etl_notify_change AFTER INSERT OR UPDATE OR DELETE ON content.film_work
+    FOR EACH ROW EXECUTE FUNCTION content.etl_notify_change();
+
+DROP TRIGGER IF EXISTS etl_notify_change ON content.person;
+CREATE TRIGGER etl_notify_change AFTER INSERT OR UPDATE OR DELETE ON content.person
+    FOR EACH ROW EXECUTE FUNCTION content.etl_notify_change();
+
+DROP TRIGGER IF EXISTS etl_notify_change ON content.genre;
+CREATE TRIGGER etl_notify_change AFTER INSERT OR UPDATE OR DELETE ON content.genre
+    FOR EACH ROW EXECUTE FUNCTION content.etl_notify_change();
+
+DROP TRIGGER IF EXISTS etl_notify_change ON content.person_film_work;
+CREATE TRIGGER etl_notify_change AFTER INSERT OR UPDATE OR DELETE ON content.person_film_work
+    FOR EACH ROW EXECUTE FUNCTION content.etl_notify_change();
+
+DROP TRIGGER IF EXISTS etl_notify_change ON content.genre_film_work;
+CREATE TRIGGER etl_notify_change AFTER INSERT OR UPDATE OR DELETE ON content.genre_film_work
+    FOR EACH ROW EXECUTE FUNCTION content.etl_notify_change();
+"""
+
+# Запросы для полной переиндексации по разделам: строки делятся
+# по хешу id, внутри раздела читаются по возрастанию id начиная с after.
+# Фильмы и персоны затем обогащаются теми же запросами по id.
+# Знаковый бит хеша сбрасывается маской: ABS(-2^31) не помещается в INTEGER
+
+__PARTITION = """
+    WHERE MOD(HASHTEXT({table}.ID::TEXT) & 2147483647, %(parts)s) = %(part)s
+        AND {table}.ID > %(after)s
+"""
+
+MOVIES_PARTITION = (
+    """
+    SELECT FW.ID
+    FROM CONTENT.FILM_WORK FW
+"""
+    + __PARTITION.format(table="FW")
+    + """
+    ORDER BY FW.ID
+"""
+)
+
+GENRES_PARTITION = (
+    """
+    SELECT
+        G.ID
+        ,G.NAME
+        ,G.DESCRIPTION
+        ,G.CREATED_AT
+        ,G.UPDATED_AT
+    FROM CONTENT.GENRE G
+"""
+    + __PARTITION.format(table="G")
+    + """
+    ORDER BY G.ID
+"""
+)
+
+PERSONS_PARTITION = (
+    """
+    SELECT
+        P.ID,
+        P.FULL_NAME,
+        P.UPDATED_AT
+    FROM CONTENT.PERSON P
+"""
+    + __PARTITION.format(table="P")
+    + """
+    ORDER BY P.ID
+"""
+)
@@ -2,8 +2,14 @@ import abc
 import contextlib
 import json
 import os
+import tempfile
+import threading
+import time
 from typing import Any, Dict
 
+import psycopg2
+from redis import Redis
+
 
 class BaseStorage(abc.ABC):
     """Абстрактное хранилище состояния.
@@ -33,9 +39,24 @@ class JsonFileStorage(BaseStorage):
         self.file_path = file_path
 
     def save_state(self, state: Dict[str, Any]) -> None:
-        """Сохранить состояние в хранилище."""
-        with open(self.file_path, "w") as f:
+        """Сохранить состояние в хранилище.
+
+        Запись атомарная: состояние пишется во временный файл рядом,
+        сбрасывается на диск и переименовывается поверх старого.
+        """
+        directory = os.path.dirname(os.path.abspath(self.file_path))
+
+        with tempfile.NamedTemporaryFile("w", dir=directory, delete=False) as f:
             f.write(json.dumps(state))
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(f.name, self.file_path)
+
+        dir_fd = os.open(directory, os.O_RDONLY)
+        try:
+            os.fsync(dir_fd)
+        finally:
+            os.close(dir_fd)
 
     def retrieve_state(self) -> Dict[str, Any]:
         """Получить состояние из хранилища."""
@@ -46,16 +67,110 @@ class JsonFileStorage(BaseStorage):
         return {}
 
 
+class RedisStorage(BaseStorage):
+    """Реализация хранилища, использующего ключ в Redis.
+
+    Формат хранения: JSON
+    """
+
+    def __init__(self, redis: Redis, key: str) -> None:
+        self.redis = redis
+        self.key = key
+
+    def save_state(self, state: Dict[str, Any]) -> None:
+        """Сохранить состояние в хранилище."""
+        self.redis.set(self.key, json.dumps(state))
+
+    def retrieve_state(self) -> Dict[str, Any]:
+        """Получить состояние из хранилища."""
+        data = self.redis.get(self.key)
+        if data:
+            with contextlib.suppress(json.JSONDecodeError):
+                return json.loads(data)
+        return {}
+
+
+class PostgresStorage(BaseStorage):
+    """Реализация хранилища, использующего таблицу в PG.
+
+    Формат хранения: JSONB в строке с ключом name
+    """
+
+    def __init__(self, dsn: str, name: str, table: str = "public.etl_state") -> None:
+        self.dsn = dsn
+        self.name = name
+        self.table = table
+
+        with self._connect() as conn, conn.cursor() as cur:
+            cur.execute(
+                f"CREATE TABLE IF NOT EXISTS {self.table} "
+                "(name TEXT PRIMARY KEY, state JSONB NOT NULL)"
+            )
+
+    def _connect(self):
+        return contextlib.closing(psycopg2.connect(dsn=self.dsn))
+
+    def save_state(self, state: Dict[str, Any]) -> None:
+        """Сохранить состояние в хранилище."""
+        with self._connect() as conn, conn, conn.cursor() as cur:
+            cur.execute(
+                f"INSERT INTO {self.table} (name, state) VALUES (%s, %s) "
+                "ON CONFLICT (name) DO UPDATE SET state = EXCLUDED.state",
+                (self.name, json.dumps(state)),
+            )
+
+    def retrieve_state(self) -> Dict[str, Any]:
+        """Получить состояние из хранилища."""
+        with self._connect() as conn, conn, conn.cursor() as cur:
+            cur.execute(f"SELECT state FROM {self.table} WHERE name = %s", (self.name,))
+            row = cur.fetchone()
+        return row[0] if row else {}
+
+
 class State:
     """Класс для работы с состояниями."""
 
     def __init__(self, storage: BaseStorage) -> None:
         self.storage = storage
+        self._lock = threading.Lock()
 
     def set_state(self, key: str, value: Any) -> None:
-        """Установить состояние для определённого ключа."""
-        self.storage.save_state({key: value})
+        """Установить состояние для определённого ключа.
+
+        Остальные ключи сохраняются: у каждой сущности своя отметка.
+        """
+        with self._lock:
+            state = self.storage.retrieve_state()
+            state[key] = value
+            self.storage.save_state(state)
 
     def get_state(self, key: str) -> Any:
         """Получить состояние по определённому ключу."""
         return self.storage.retrieve_state().get(key)
+
+
+class Checkpoint:
+    """Периодическое сохранение отметки одной сущности.
+
+    commit вызывается после каждой записанной пачки, в хранилище
+    отметка попадает не чаще раза в interval секунд и при flush.
+    """
+
+    def __init__(self, state: State, key: str, interval: float) -> None:
+        self.state = state
+        self.key = key
+        self.interval = interval
+        self.value = None
+        self._saved = None
+        self._saved_at = time.monotonic()
+
+    def commit(self, value: Any) -> None:
+        self.value = value
+        if time.monotonic() - self._saved_at >= self.interval:
+            self.flush()
+
+    def flush(self) -> None:
+        if self.value is not None and self.value != self._saved:
+            self.state.set_state(self.key, self.value)
+            self._saved = self.value
+        self._saved_at = time.monotonic()
@@ -1,53 +1,54 @@
-from models import PersonShort
-
-
-def transform_movie_data(data):
+def movie_document(row, columns) -> dict:
     """
-    Собираем необходимую структуру данных для фильмов
+    Собираем документ фильма за один проход по персонам.
+    Порядок и состав полей совпадают с Movie.model_dump()
     """
 
-    actors = [
-        PersonShort(person_id=x["person_id"], person_name=x["person_name"])
-        for x in data.get("persons")
-        if x.get("person_role") == "actor"
-    ]
-    writers = [
-        PersonShort(person_id=x["person_id"], person_name=x["person_name"])
-        for x in data.get("persons")
-        if x.get("person_role") == "writer"
-    ]
-
-    return data | dict(
-        title=data.get("title"),
-        description=data.get("description"),
-        director=" ".join(
-            [
-                x.get("person_name")
-                for x in data.get("persons")
-                if x.get("person_role") == "director"
-            ]
-        ).strip(),
-        actors_names=" ".join([person.name for person in actors]),
-        writers_names=[person.name for person in writers],
-        actors=actors,
-        writers=writers,
-    )
-
-
-def transform_person_data(data):
+    directors, actors, writers = [], [], []
+    by_role = {"director": directors, "actor": actors, "writer": writers}
+
+    for person in row[columns["persons"]]:
+        group = by_role.get(person.get("person_role"))
+        if group is not None:
+            group.append({"id": person["person_id"], "name": person["person_name"]})
+
+    return {
+        "id": row[columns["id"]],
+        "imdb_rating": row[columns["rating"]],
+        "title": row[columns["title"]],
+        "description": row[columns["description"]],
+        "genre": row[columns["genres"]],
+        "director": " ".join([x["name"] for x in directors]).strip(),
+        "actors_names": " ".join([x["name"] for x in actors]),
+        "writers_names": [x["name"] for x in writers],
+        "actors": actors,
+        "writers": writers,
+    }
+
+
+def person_document(row, columns) -> dict:
     """
-    Собираем необходимую структуру данных для персон
+    Собираем документ персоны: роли группируются по фильму за один проход,
+    фильмы идут в порядке первого появления
     """
 
-    films = []
-
-    for i in data["films"]:
-        if i not in films:
-            films.append(
-                {
-                    "id": i["id"],
-                    "roles": [x["role"] for x in data["films"] if x["id"] == i["id"]],
-                }
-            )
-
-    return dict(id=data["id"], full_name=data["full_name"], films=films)
+    films = {}
+    for film in row[columns["films"]] or []:
+        roles = films.get(film["id"])
+        if roles is None:
+            films[film["id"]] = roles = []
+        roles.append(film["role"])
+
+    return {
+        "id": row[columns["id"]],
+        "full_name": row[columns["full_name"]],
+        "films": [{"id": film_id, "roles": roles} for film_id, roles in films.items()],
+    }
+
+
+def genre_document(row, columns) -> dict:
+    return {
+        "id": row[columns["id"]],
+        "name": row[columns["name"]],
+        "description": row[columns["description"]],
+    }